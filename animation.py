@@ -0,0 +1,200 @@
+import os
+import time
+from dataclasses import dataclass
+import numpy as np
+from PIL import Image, ImageSequence
+import error_diffusion
+import gif_writer
+import palette
+import pipeline
+import shapes
+import threshold_maps
+import tone
+
+TILE = 64
+FRAME_MS = 100
+
+@dataclass
+class AnimationSummary:
+    frames: int = 0
+    written: int = 0
+    dropped: int = 0
+    tiles: int = 0
+    reused: int = 0
+    seconds: float = 0.0
+    cancelled: bool = False
+
+    @property
+    def reuse(self):
+        return self.reused / self.tiles if self.tiles else 0.0
+
+def frame_count(source):
+    if os.path.isdir(source):
+        return len(gif_writer.frame_paths(source))
+    with Image.open(source) as img:
+        return getattr(img, "n_frames", 1)
+
+def source_frames(source, duration=FRAME_MS, workers=None):
+    # (RGB image, duration in ms) for every frame of a folder of images or
+    # an animated GIF/PNG. Folder frames are resized to the first one.
+    if os.path.isdir(source):
+        paths = gif_writer.frame_paths(source)
+        if not paths:
+            return
+        size = Image.open(paths[0]).size
+        for rgba in gif_writer.iter_frames(paths, size, workers):
+            yield Image.fromarray(rgba).convert("RGB"), duration
+    else:
+        with Image.open(source) as img:
+            for frame in ImageSequence.Iterator(img):
+                yield frame.convert("RGB"), frame.info.get("duration") or duration
+
+def gray_frame(img, params):
+    # The dither input of render_shapes / render_dither
+    return tone.apply(pipeline.gray_image(img, params.zoom), params)
+
+def _runs(flags):
+    # (start, stop) of every run of True in a 1-D bool array
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], flags.astype(np.int8), [0]])))
+    return zip(edges[::2], edges[1::2])
+
+def _dilate(tiles, n):
+    out = tiles.copy()
+    for _ in range(n):
+        grown = out.copy()
+        grown[1:] |= out[:-1]
+        grown[:-1] |= out[1:]
+        grown[:, 1:] |= out[:, :-1]
+        grown[:, :-1] |= out[:, 1:]
+        out = grown
+    return out
+
+class FrameDitherer:
+    # Dithers consecutive frames of one size, reusing the previous frame's
+    # output wherever its input did not change. The input is compared in
+    # tiles; shape tiles are re-rendered with their neighbours' stamps,
+    # ordered tiles on their own, and error diffusion restarts at the first
+    # changed strip from the error rows saved there on the previous frame.
+    # Threshold maps and shape angles depend only on pixel and cell
+    # position, so reused and re-rendered tiles always agree.
+    def __init__(self, params, mode="shapes", tile=TILE):
+        self.params = params
+        self.mode = mode
+        if mode == "shapes":
+            tile = max(1, tile // params.detail) * params.detail
+        self.tile = tile
+        self.gray = self.out = None
+        self.checkpoints = []
+        self.tiles = self.reused = 0
+
+    def process(self, gray):
+        t = self.tile
+        h, w = gray.shape
+        th, tw = -(-h // t), -(-w // t)
+        if self.gray is None or self.gray.shape != gray.shape:
+            changed = np.ones((th, tw), bool)
+            self.out = np.zeros((h, w), np.uint8)
+            self.checkpoints = []
+        else:
+            diff = np.zeros((th * t, tw * t), bool)
+            np.not_equal(gray, self.gray, out=diff[:h, :w])
+            changed = diff.reshape(th, t, tw, t).any(axis=(1, 3))
+        out = self.out.copy()
+        if self.mode == "shapes":
+            dirty = self._shapes(gray, out, changed)
+        elif self.params.algorithm == "Ordered":
+            dirty = self._ordered(gray, out, changed)
+        else:
+            dirty = self._diffuse(gray, out, changed)
+        self.tiles += dirty.size
+        self.reused += dirty.size - int(dirty.sum())
+        self.gray, self.out = gray, out
+        return out
+
+    def _spans(self, dirty, shape):
+        t = self.tile
+        h, w = shape
+        for i, row in enumerate(dirty):
+            for j0, j1 in _runs(row):
+                yield i * t, min(h, (i + 1) * t), j0 * t, min(w, j1 * t)
+
+    def _shapes(self, gray, out, changed):
+        p = self.params
+        r = shapes.stamp_radius(p.dot_size)
+        halo = -(-r // p.detail) * p.detail
+        # A changed cell's stamp reaches r past the cell on every side
+        dirty = _dilate(changed, -(-(r + p.detail) // self.tile))
+        h, w = gray.shape
+        for y0, y1, x0, x1 in self._spans(dirty, gray.shape):
+            a, b, c, d = max(0, y0 - halo), min(h, y1 + halo), max(0, x0 - halo), min(w, x1 + halo)
+            mask = shapes.render(gray[a:b, c:d], p.shape, p.dot_size, p.detail, p.threshold,
+                                 cell_row0=a // p.detail, cell_col0=c // p.detail)
+            out[y0:y1, x0:x1] = mask[y0 - a:y1 - a, x0 - c:x1 - c]
+        return dirty
+
+    def _ordered(self, gray, out, changed):
+        for y0, y1, x0, x1 in self._spans(changed, gray.shape):
+            out[y0:y1, x0:x1] = threshold_maps.ordered_dither(gray[y0:y1, x0:x1], self.params.threshold_map, y0, x0)
+        return changed
+
+    def _diffuse(self, gray, out, changed):
+        # Rows above the first change diffuse exactly as before. From there
+        # strips are redone until a strip ends on the same error rows as last
+        # time with no change below it, after which the old output holds too.
+        p, t = self.params, self.tile
+        rows = changed.any(axis=1)
+        dirty = np.zeros_like(changed)
+        if not rows.any():
+            return dirty
+        first = int(np.argmax(rows))
+        diffuser = error_diffusion.ErrorDiffuser(gray.shape[1], p.threshold, p.algorithm, p.serpentine)
+        if first:
+            diffuser.carry, diffuser.row = self.checkpoints[first]
+        checkpoints = self.checkpoints[:first + 1] or [(diffuser.carry, 0)]
+        old = self.checkpoints
+        for i in range(first, len(rows)):
+            out[i * t:(i + 1) * t] = diffuser.process(gray[i * t:(i + 1) * t])
+            dirty[i] = True
+            checkpoints.append((diffuser.carry, diffuser.row))
+            if i + 1 < len(old) and not rows[i + 1:].any() and np.array_equal(diffuser.carry, old[i + 1][0]):
+                checkpoints += old[i + 2:]
+                break
+        self.checkpoints = checkpoints
+        return dirty
+
+def dither_animation(source, out_path, params, mode="shapes", duration=FRAME_MS, loop=0, drop_duplicates=True,
+                     workers=None, progress=None, cancel=None):
+    # Dithers every frame of `source` (a folder or an animated GIF/PNG) and
+    # writes them straight into an animated GIF
+    if mode == "dither" and params.color_mode == "full":
+        # Frames are diffed and encoded as two-colour masks
+        raise ValueError("Animations are dithered in two colours; full colour is not supported")
+    start = time.perf_counter()
+    summary = AnimationSummary()
+    if params.color_mode == "color":
+        lut = palette.build_lut(params.palette, params.hue)
+        colors = np.array([lut[0], lut[255]], np.uint8)
+    else:
+        colors = np.array([[0, 0, 0], [255, 255, 255]], np.uint8)
+    total = frame_count(source)
+    ditherer = FrameDitherer(params, mode)
+    writer = None
+    try:
+        for img, ms in source_frames(source, duration, workers):
+            if cancel is not None and cancel.is_set():
+                summary.cancelled = True
+                break
+            mask = ditherer.process(gray_frame(img, params))
+            if writer is None:
+                writer = gif_writer.GifWriter(out_path, (mask.shape[1], mask.shape[0]), colors, loop, drop_duplicates)
+            writer.write((mask > 0).view(np.uint8), ms)
+            summary.frames += 1
+            if progress:
+                progress(summary.frames, total)
+    finally:
+        if writer is not None:
+            writer.close()
+            summary.written, summary.dropped = writer.frames, writer.dropped
+    summary.tiles, summary.reused = ditherer.tiles, ditherer.reused
+    summary.seconds = time.perf_counter() - start
+    return summary
@@ -0,0 +1,202 @@
+import json
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from PIL import Image
+import pipeline
+import profiling
+import tiled
+import vector_export
+
+RENDERERS = {"shapes": pipeline.render_shapes, "dither": pipeline.render_dither}
+
+@dataclass
+class FileResult:
+    src: str
+    dst: str
+    megapixels: float = 0.0
+    seconds: float = 0.0
+    error: str = None
+    stages: list = field(default_factory=list)
+    cached: bool = False
+
+@dataclass
+class BatchSummary:
+    total: int
+    done: int = 0
+    megapixels: float = 0.0
+    elapsed: float = 0.0
+    cancelled: bool = False
+    errors: list = field(default_factory=list)
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+    @property
+    def files_per_s(self):
+        return self.done / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mp_per_s(self):
+        return self.megapixels / self.elapsed if self.elapsed else 0.0
+
+def folder_jobs(input_dir, output_dir):
+    files = sorted(f for f in os.listdir(input_dir) if os.path.splitext(f)[1].lower() in pipeline.IMAGE_EXTS)
+    jobs = []
+    for fname in files:
+        name, ext = os.path.splitext(fname)
+        jobs.append((os.path.join(input_dir, fname), os.path.join(output_dir, f"{name}_dithered{ext}")))
+    return jobs
+
+def process_file(src, dst, params, mode="shapes", memory_mb=None):
+    # Runs in a worker process, so errors are returned rather than raised.
+    # With a memory budget, large PNG outputs are streamed in strips; SVG and
+    # PDF outputs are written as vector shapes.
+    start = time.perf_counter()
+    recorder = profiling.StageRecorder()
+    try:
+        if vector_export.is_vector(dst) and mode != "shapes":
+            raise ValueError("SVG and PDF output needs shape dithering")
+        img = recorder.timed("decode", lambda: Image.open(src).convert("RGB"))
+        if vector_export.is_vector(dst):
+            recorder.timed("vector", vector_export.export, img, dst, params)
+        elif memory_mb and dst.lower().endswith(".png") and tiled.needs_tiling(img, params, memory_mb):
+            recorder.timed("tiled", tiled.render_to_png, img, dst, params, mode, memory_mb, workers=1)
+        else:
+            out = RENDERERS[mode](img, params, recorder)
+            recorder.timed("save", out.save, dst)
+        return FileResult(src, dst, img.width * img.height / 1e6, time.perf_counter() - start, stages=recorder.records)
+    except Exception as e:
+        return FileResult(src, dst, seconds=time.perf_counter() - start, error=f"{type(e).__name__}: {e}", stages=recorder.records)
+
+def cache_lookup(cache, src, dst, params, mode):
+    # (FileResult if dst was filled from the cache else None, cache key).
+    # Unreadable sources get no key and fail later with a proper error.
+    start = time.perf_counter()
+    recorder = profiling.StageRecorder()
+    ext = os.path.splitext(dst)[1]
+    try:
+        key = recorder.timed("hash", cache.key, src, params, mode, ext)
+        if recorder.timed("fetch", cache.fetch, key, ext, dst):
+            # Only the header is read, for the pixel count throughput is measured in
+            with Image.open(src) as img:
+                megapixels = img.width * img.height / 1e6
+            return FileResult(src, dst, megapixels, time.perf_counter() - start, stages=recorder.records, cached=True), key
+    except OSError:
+        return None, None
+    return None, key
+
+def process_cached(src, dst, params, mode, cache, memory_mb=None):
+    # process_file behind the result cache. Also runs in a worker, so hashing
+    # and copying sources in and out of the cache is spread over the pool.
+    hit, key = cache_lookup(cache, src, dst, params, mode)
+    if hit is not None:
+        return hit
+    result = process_file(src, dst, params, mode, memory_mb)
+    if key is not None and not result.error:
+        try:
+            cache.store(key, os.path.splitext(dst)[1], dst)
+        except OSError:
+            pass  # the output itself is fine; it just isn't cached
+    return result
+
+def log_line(result):
+    return json.dumps(dict(file=result.src, output=result.dst, seconds=round(result.seconds, 6),
+                           megapixels=round(result.megapixels, 6), error=result.error, cached=result.cached,
+                           stages=result.stages))
+
+def run(jobs, params, workers=None, mode="shapes", events=None, cancel=None, memory_mb=None, log_path=None, cache=None):
+    # Blocking; meant to be called from a background thread. Each FileResult
+    # is put on `events` as ("result", result, summary) and the run ends with
+    # ("finished", None, summary). Setting `cancel` stops new files starting.
+    # With log_path, every file's stage timings are appended as a JSON line.
+    # With a ResultCache, each worker copies results already rendered with
+    # these settings from it and adds the ones it renders; the cache is
+    # trimmed to its cap at the end.
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs) or 1))
+    summary = BatchSummary(total=len(jobs))
+    start = time.perf_counter()
+    events = events if events is not None else queue.Queue()
+    log = open(log_path, "a") if log_path else None
+
+    def task(job):
+        if cache is None:
+            return process_file, (job[0], job[1], params, mode, memory_mb)
+        return process_cached, (job[0], job[1], params, mode, cache, memory_mb)
+
+    def record(result):
+        if log is not None:
+            log.write(log_line(result) + "\n")
+            log.flush()
+        summary.done += 1
+        summary.megapixels += result.megapixels
+        if result.error:
+            summary.errors.append((result.src, result.error))
+        elif result.cached:
+            summary.cache_hits += 1
+        elif cache is not None:
+            summary.cache_misses += 1
+        summary.elapsed = time.perf_counter() - start
+        events.put(("result", result, summary))
+
+    try:
+        if workers == 1:
+            for src, dst in jobs:
+                if cancel is not None and cancel.is_set():
+                    summary.cancelled = True
+                    break
+                fn, args = task((src, dst))
+                record(fn(*args))
+        else:
+            # Spawned workers never inherit the Tk interpreter; submissions are
+            # bounded so cancellation takes effect within a couple of files
+            pending = iter(jobs)
+            in_flight = {}  # future -> job
+            pool = start_pool(workers)
+            try:
+                while True:
+                    while not (cancel is not None and cancel.is_set()) and len(in_flight) < workers * 2:
+                        job = next(pending, None)
+                        if job is None:
+                            break
+                        fn, args = task(job)
+                        in_flight[pool.submit(fn, *args)] = job
+                    if not in_flight:
+                        break
+                    finished, _ = wait(in_flight, timeout=0.2, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record(future_result(future, in_flight.pop(future)))
+                    if any(isinstance(f.exception(), BrokenProcessPool) for f in finished):
+                        # A worker died (often out of memory) and took the pool
+                        # with it: the files in flight fail, the rest go on in
+                        # a new pool
+                        for future, job in in_flight.items():
+                            record(future_result(future, job))
+                        in_flight.clear()
+                        pool.shutdown(wait=False)
+                        pool = start_pool(workers)
+            finally:
+                pool.shutdown(cancel_futures=True)
+            summary.cancelled = cancel is not None and cancel.is_set() and summary.done < summary.total
+        if cache is not None:
+            cache.evict()
+    finally:
+        if log is not None:
+            log.close()
+        summary.elapsed = time.perf_counter() - start
+        events.put(("finished", None, summary))
+    return summary
+
+def start_pool(workers):
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+def future_result(future, job):
+    # The FileResult of a worker, or an error result when the worker could
+    # not report one
+    try:
+        return future.result()
+    except Exception as e:
+        return FileResult(job[0], job[1], error=f"{type(e).__name__}: {e}")
@@ -0,0 +1,187 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import re
+import sys
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+import batch
+import error_diffusion
+import palette
+import pipeline
+import shapes
+import threshold_maps
+
+SIZES_MP = [0.25, 1, 4, 24, 100]
+DETAILS = [2, 8, 32]
+BATCH_FILES = 8
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_TIMEOUT_S = 1800  # per case; 100 MP shape cases take a few minutes
+
+def synthetic_image(megapixels, seed=0):
+    # 3:2 gradient with noise so every algorithm has real work to do
+    h = max(1, int(round((megapixels * 1e6 / 1.5) ** 0.5)))
+    w = max(1, int(round(h * 1.5)))
+    y = np.linspace(0, 1, h, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, w, dtype=np.float32)[None, :]
+    noise = np.random.default_rng(seed).integers(0, 48, (h, w), dtype=np.uint8)
+    return ((x * 0.6 + y * 0.4) * 200).astype(np.uint8) + noise
+
+def _diffusion(kernel):
+    return lambda gray: error_diffusion.diffuse(gray, 128, kernel)
+
+def _shapes(shape, detail):
+    return lambda gray: shapes.render(gray, shape, 8, detail, 96)
+
+def _color(gray):
+    return palette.colorize(gray, palette.build_lut("Mono Hue", 0.6))
+
+def _batch(gray):
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Image.fromarray(gray).convert("RGB")
+        for i in range(BATCH_FILES):
+            src.save(os.path.join(tmp, f"frame{i:03d}.png"))
+        out_dir = os.path.join(tmp, "out")
+        os.makedirs(out_dir)
+        start = time.perf_counter()
+        summary = batch.run(batch.folder_jobs(tmp, out_dir), pipeline.DitherParams())
+        if summary.errors:
+            raise RuntimeError(summary.errors[0][1])
+        return time.perf_counter() - start
+
+def cases():
+    # name -> (function of a grayscale array, images processed per call)
+    table = {
+        "floyd_steinberg": (_diffusion("Floyd-Steinberg"), 1),
+        "atkinson_dither": (_diffusion("Atkinson"), 1),
+        "ordered_dither": (lambda gray: threshold_maps.ordered_dither(gray, "Bayer 8x8"), 1),
+        "color": (_color, 1),
+        "batch_folder": (_batch, BATCH_FILES),
+    }
+    for shape in pipeline.SHAPES:
+        for detail in DETAILS:
+            table[f"shape_dither[{shape}, detail={detail}]"] = (_shapes(shape, detail), 1)
+    return table
+
+def peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def _run_case(name, megapixels, repeat, results):
+    # Runs in a fresh process so peak RSS belongs to this case alone
+    try:
+        fn, images = cases()[name]
+        gray = synthetic_image(megapixels)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            timed = fn(gray)
+            elapsed = time.perf_counter() - start
+            times.append(timed if isinstance(timed, float) else elapsed)
+        seconds = min(times)
+        results.put(dict(name=name, megapixels=megapixels, seconds=seconds,
+                         mp_per_s=megapixels * images / seconds if seconds else 0.0,
+                         peak_rss_mb=peak_rss_mb()))
+    except Exception as e:
+        results.put(dict(name=name, megapixels=megapixels, error=f"{type(e).__name__}: {e}"))
+
+def run_case(name, megapixels, repeat, timeout=DEFAULT_TIMEOUT_S):
+    # A child that crashes or is killed (the OOM killer at 100 MP) reports
+    # nothing, so wait for a result only while it is alive
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_run_case, args=(name, megapixels, repeat, results))
+    proc.start()
+    deadline = time.monotonic() + timeout
+    result = None
+    while result is None:
+        try:
+            result = results.get(timeout=1.0)
+        except queue.Empty:
+            if not proc.is_alive():
+                try:
+                    result = results.get(timeout=1.0)  # sent just before exiting
+                except queue.Empty:
+                    result = dict(name=name, megapixels=megapixels, error=f"worker exited with code {proc.exitcode}")
+            elif time.monotonic() > deadline:
+                proc.kill()
+                result = dict(name=name, megapixels=megapixels, error=f"timed out after {timeout:g}s")
+    proc.join()
+    return result
+
+def environment():
+    return dict(python=platform.python_version(), numpy=np.__version__, platform=platform.platform(),
+                cpus=os.cpu_count(), numba=error_diffusion.numba is not None)
+
+def compare(results, baseline, tolerance, selected=None):
+    # Cases slower than the baseline beyond the tolerance, or timed in the
+    # baseline but without a time now, as (new, old); new has no "seconds"
+    # when the case failed or is gone. `selected(name, megapixels)` limits
+    # the baseline to the cases this run was asked for.
+    previous = {(r["name"], r["megapixels"]): r for r in baseline.get("results", [])
+                if "seconds" in r and (selected is None or selected(r["name"], r["megapixels"]))}
+    current = {(r["name"], r["megapixels"]): r for r in results}
+    regressions = []
+    for key, old in previous.items():
+        r = current.get(key, dict(name=key[0], megapixels=key[1], error="missing from the results"))
+        if "seconds" not in r or r["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append((r, old))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time every dithering path on synthetic images.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in SIZES_MP), help="comma separated megapixel sizes")
+    parser.add_argument("-k", "--cases", default="", help="regular expression selecting case names")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest is reported")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_S, help="seconds before a case is stopped")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--list", action="store_true", help="list case names and exit")
+    args = parser.parse_args(argv)
+
+    names = [n for n in cases() if re.search(args.cases, n)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+    sizes = [float(s) for s in args.sizes.split(",") if s]
+    results = []
+    print(f"{'case':52} {'MP':>7} {'seconds':>9} {'MP/s':>9} {'peak MB':>9}")
+    for megapixels in sizes:
+        for name in names:
+            r = run_case(name, megapixels, args.repeat, args.timeout)
+            results.append(r)
+            if "error" in r:
+                print(f"{name:52} {megapixels:7g}  ERROR {r['error']}")
+            else:
+                print(f"{name:52} {megapixels:7g} {r['seconds']:9.3f} {r['mp_per_s']:9.2f} {r['peak_rss_mb']:9.1f}")
+    report = dict(environment=environment(), results=results)
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    status = 1 if any("error" in r for r in results) else 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance,
+                                  lambda name, megapixels: re.search(args.cases, name) and megapixels in sizes)
+        for r, old in regressions:
+            if "seconds" not in r:
+                print(f"REGRESSION {r['name']} @ {r['megapixels']:g} MP: {old['seconds']:.3f}s -> {r['error']}", file=sys.stderr)
+                continue
+            print(f"REGRESSION {r['name']} @ {r['megapixels']:g} MP: {old['seconds']:.3f}s -> {r['seconds']:.3f}s "
+                  f"(+{(r['seconds'] / old['seconds'] - 1) * 100:.0f}%, tolerance {args.tolerance * 100:.0f}%)", file=sys.stderr)
+        if regressions:
+            status = 1
+        else:
+            print(f"No regressions beyond {args.tolerance * 100:.0f}% against {args.baseline}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import numpy as np
+from PIL import Image
+import error_diffusion
+import palette
+import threshold_maps
+import tone
+
+# Per-channel targets: every channel snaps to this many evenly spaced values
+LEVELS = {"RGB (8 colors)": 2, "RGB (27 colors)": 3, "Web Safe (216 colors)": 6}
+# Palettes built from the image itself by median cut
+ADAPTIVE = {"Adaptive (16 colors)": 16, "Adaptive (256 colors)": 256}
+PALETTE_OPTIONS = list(LEVELS) + list(ADAPTIVE) + list(palette.PALETTES)
+SAMPLE_SIDE = 256
+BLOCK_ROWS = 256  # rows of float work per ordered dither block
+
+class Quantizer:
+    # Nearest colour for full-colour dithering. With `levels` every channel
+    # snaps on its own to that many evenly spaced values, and two levels
+    # split at the threshold exactly like the gray path. With `colors` a 3D
+    # table of nearest palette entries (palette.palette_lut) is looked up, so
+    # the cost per pixel does not grow with the palette.
+    def __init__(self, levels=2, threshold=128, colors=None):
+        self.levels = 0 if colors is not None else max(2, levels)
+        self.threshold = threshold
+        self.bits = palette.LUT_BITS
+        n = max(2, levels)
+        self.values = np.rint(np.arange(n) * 255 / (n - 1)).astype(np.uint8)
+        if colors is not None:
+            self.colors = np.asarray(colors, np.uint8).reshape(-1, 3)
+            self.lut = palette.palette_lut(self.colors)
+        else:
+            self.colors = np.zeros((1, 3), np.uint8)
+            self.lut = np.zeros(1, np.uint8)
+        self.spread = 255 / (n - 1) if colors is None else _spacing(self.colors)
+
+    def quantize(self, v):
+        # (..., 3) float values to uint8 colours
+        if self.levels == 2:
+            return np.multiply(v > self.threshold, 255, dtype=np.uint8)
+        t = np.clip(v, 0, 255)
+        if self.levels:
+            return self.values[np.floor(t * (self.levels - 1) / 255 + 0.5).astype(np.intp)]
+        c = t.astype(np.intp) >> (8 - self.bits)
+        return self.colors[self.lut[c[..., 0] << 2 * self.bits | c[..., 1] << self.bits | c[..., 2]]]
+
+def _spacing(colors):
+    # Typical distance between neighbouring palette colours: how far ordered
+    # dithering has to push a pixel to reach the next colour
+    if len(colors) < 2:
+        return 0.0
+    c = colors.astype(np.float64)
+    d = np.sqrt(((c[:, None] - c[None]) ** 2).sum(-1))
+    np.fill_diagonal(d, np.inf)
+    return float(np.median(d.min(1)))
+
+def adaptive_colors(img, params, count):
+    # Median cut palette of a small copy of the toned source, so in-memory and
+    # streamed exports pick the same colours
+    factor = max(1, -(-max(img.size) // SAMPLE_SIDE))
+    sample = img.convert("RGB").reduce(factor)
+    toned = tone_rgb(np.asarray(sample), params)
+    quant = Image.fromarray(toned).quantize(count, Image.Quantize.MEDIANCUT)
+    table = np.array(quant.getpalette(), np.uint8).reshape(-1, 3)
+    return table[np.unique(np.asarray(quant))]
+
+def quantizer(params, img=None):
+    name = params.full_palette
+    if name in LEVELS:
+        return Quantizer(LEVELS[name], params.threshold)
+    if name in ADAPTIVE:
+        return Quantizer(threshold=params.threshold, colors=adaptive_colors(img, params, ADAPTIVE[name]))
+    return Quantizer(threshold=params.threshold, colors=palette.PALETTES[name][1])
+
+def tone_rgb(rgb, params, mean=None):
+    # The tone LUT on every channel; contrast pivots on the mean luminance
+    if mean is None and tone.needs_mean(params):
+        mean = tone.contrast_mean(tone.histogram(Image.fromarray(rgb).convert("L")), params.brightness)
+    return tone.tone_lut(params, mean if mean is not None else 128)[rgb]
+
+def ordered_dither(rgb, name, quant, row0=0, col0=0):
+    # threshold_maps.ordered_dither on (h, w, 3). Per-channel two-level
+    # output compares each channel with the map like the gray path; other
+    # targets offset the pixel by the map, scaled to the colour spacing, and
+    # take the nearest colour.
+    tmap = threshold_maps.threshold_map(name)
+    n = tmap.shape[0]
+    h, w = rgb.shape[:2]
+    cols = (col0 + np.arange(w)) % n
+    out = np.empty((h, w, 3), np.uint8)
+    for y0 in range(0, h, BLOCK_ROWS):
+        y1 = min(h, y0 + BLOCK_ROWS)
+        band = tmap[(row0 + np.arange(y0, y1)) % n][:, cols]
+        if quant.levels == 2:
+            np.multiply(rgb[y0:y1] > band[..., None], 255, dtype=np.uint8, out=out[y0:y1])
+            continue
+        bias = ((band.astype(np.float32) + 0.5) / 255 - 0.5) * np.float32(quant.spread)
+        out[y0:y1] = quant.quantize(rgb[y0:y1] + bias[..., None])
+    return out
+
+def dither(rgb, params, quant):
+    # Toned (h, w, 3) uint8 to dithered RGB in one pass over all channels
+    if params.algorithm == "Ordered":
+        return ordered_dither(rgb, params.threshold_map, quant)
+    diffuser = error_diffusion.ErrorDiffuser(rgb.shape[1], params.threshold, params.algorithm, params.serpentine,
+                                             quantizer=quant)
+    return diffuser.process(rgb)
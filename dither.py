@@ -1,11 +1,26 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk, ImageEnhance, ImageDraw
-import numpy as np
-import colorsys
+from PIL import Image, ImageTk
 import threading
+import queue
 import os
-import math
+import animation
+import batch
+import color_dither
+import palette
+import pipeline
+import tiled
+import stage_cache
+import preview_renderer
+import threshold_maps
+import tone
+import vector_export
+import viewport
+import watch_folder
+import profiling
+import result_cache
+
+MEMORY_MB = 1024  # default budget before saves are streamed in strips
 
 class CollapsibleSection(ttk.Frame):
     def __init__(self, parent, title, *args, **kwargs):
@@ -28,24 +43,41 @@ class DitherDockApp:
         self.root.geometry("1200x800")  # Removed redundant geometry setting
         self.root.configure(bg="#222")
         self.image = None
-        self.preview_image = None
+        self.pyramid = None
+        self.view_scale = None  # screen pixels per output pixel; None fits the window
+        self.view_fx = self.view_fy = 0.5
+        self.drag_start = None
         self.display_image = None
         self.processed_image = None
         self.image_path = None
-        self.dither_algorithms = ["Floyd-Steinberg", "Ordered", "Atkinson"]
+        self.preview_cache = stage_cache.StageCache(256 * 2**20)
+        self.preview_key = 0
+        self.preview_renderer = preview_renderer.PreviewRenderer(self.preview_cache)
+        self.dither_algorithms = pipeline.ALGORITHMS
         self.dither_algorithm = tk.StringVar(value=self.dither_algorithms[0])
         self.dither_strength = tk.IntVar(value=128)
+        self.serpentine = tk.BooleanVar(value=False)
+        self.threshold_map = tk.StringVar(value="Bayer 8x8")
         self.brightness = tk.DoubleVar(value=1.0)
         self.contrast = tk.DoubleVar(value=1.0)
         self.black_clip = tk.IntVar(value=0)
+        self.gamma = tk.DoubleVar(value=1.0)
+        self.levels_low = tk.IntVar(value=0)
+        self.levels_high = tk.IntVar(value=255)
+        self.curve = tk.StringVar(value="")
         self.dot_size = tk.IntVar(value=4)
-        self.shape_options = ["Circles", "Squares (aligned)", "Triangles (aligned)", "Squares (random)", "Triangles (random)"]
+        self.shape_options = pipeline.SHAPES
         self.shape = tk.StringVar(value=self.shape_options[0])
         self.zoom = tk.DoubleVar(value=1.0)
         self.color_mode = tk.StringVar(value="grayscale")
         self.hue = tk.DoubleVar(value=0.0)
+        self.palette = tk.StringVar(value=palette.PALETTE_OPTIONS[0])
+        self.full_palette = tk.StringVar(value=color_dither.PALETTE_OPTIONS[0])
         self.debounce_timer = None
         self.detail = tk.IntVar(value=8)
+        self.batch_workers = tk.IntVar(value=os.cpu_count() or 1)
+        self.memory_mb = tk.IntVar(value=MEMORY_MB)
+        self.cache_mb = tk.IntVar(value=0)
         self.setup_ui()
 
     def setup_ui(self):
@@ -54,6 +86,13 @@ class DitherDockApp:
         # Main image display
         self.canvas = tk.Canvas(self.root, bg="#222", highlightthickness=0)
         self.canvas.pack(fill=tk.BOTH, expand=True)
+        # Wheel zooms about the pointer, drag pans, double-click fits the window
+        self.canvas.bind("<MouseWheel>", lambda e: self.zoom_view(e, 1.25 if e.delta > 0 else 0.8))
+        self.canvas.bind("<Button-4>", lambda e: self.zoom_view(e, 1.25))
+        self.canvas.bind("<Button-5>", lambda e: self.zoom_view(e, 0.8))
+        self.canvas.bind("<ButtonPress-1>", self.start_pan)
+        self.canvas.bind("<B1-Motion>", self.pan_view)
+        self.canvas.bind("<Double-Button-1>", lambda e: self.fit_view())
 
         # Bottom dock frame (responsive, word-wrap style)
         self.dock = tk.Frame(self.root, bg="#222", height=120)
@@ -76,11 +115,28 @@ class DitherDockApp:
         # Black Clip
         add_control("Black Clip:", ttk.Scale(self.dock, from_=0, to=128, variable=self.black_clip, orient=tk.HORIZONTAL, command=lambda e: self.debounced_update_preview(), length=80))
         add_control("", ttk.Entry(self.dock, textvariable=self.black_clip, width=5))
+        # Gamma
+        add_control("Gamma:", ttk.Scale(self.dock, from_=0.2, to=5.0, variable=self.gamma, orient=tk.HORIZONTAL, command=lambda e: self.debounced_update_preview(), length=80))
+        add_control("", ttk.Entry(self.dock, textvariable=self.gamma, width=5))
+        # Input levels
+        add_control("Levels:", ttk.Scale(self.dock, from_=0, to=254, variable=self.levels_low, orient=tk.HORIZONTAL, command=lambda e: self.debounced_update_preview(), length=60))
+        add_control("", ttk.Scale(self.dock, from_=1, to=255, variable=self.levels_high, orient=tk.HORIZONTAL, command=lambda e: self.debounced_update_preview(), length=60))
+        # Tone curve control points, "x,y x,y ..."
+        curve_entry = ttk.Entry(self.dock, textvariable=self.curve, width=16)
+        curve_entry.bind("<Return>", lambda e: self.debounced_update_preview())
+        curve_entry.bind("<FocusOut>", lambda e: self.debounced_update_preview())
+        add_control("Curve:", curve_entry)
         # Algorithm
         algo_combo = ttk.Combobox(self.dock, textvariable=self.dither_algorithm, values=self.dither_algorithms, state="readonly", width=15)
         algo_combo.bind("<Button-1>", self.show_dropup)
         algo_combo.bind("<<ComboboxSelected>>", lambda e: self.debounced_update_preview())
         add_control("Algorithm:", algo_combo)
+        # Serpentine scanning for error diffusion
+        self.dock_controls.append(ttk.Checkbutton(self.dock, text="Serpentine", variable=self.serpentine, command=self.debounced_update_preview))
+        # Threshold map for ordered dithering
+        map_combo = ttk.Combobox(self.dock, textvariable=self.threshold_map, values=threshold_maps.MAP_OPTIONS, state="readonly", width=12)
+        map_combo.bind("<<ComboboxSelected>>", lambda e: self.debounced_update_preview())
+        add_control("Map:", map_combo)
         # Brightness Threshold
         add_control("Brightness Threshold:", ttk.Scale(self.dock, from_=0, to=255, variable=self.dither_strength, orient=tk.HORIZONTAL, command=lambda e: self.debounced_update_preview(), length=80))
         add_control("", ttk.Entry(self.dock, textvariable=self.dither_strength, width=5))
@@ -100,22 +156,48 @@ class DitherDockApp:
         # Color toggle
         color_toggle = ttk.Checkbutton(self.dock, text="Color", variable=self.color_mode, onvalue="color", offvalue="grayscale", command=self.debounced_update_preview)
         self.dock_controls.append(color_toggle)
+        # Full colour: dither the RGB channels instead of colorizing gray
+        full_toggle = ttk.Checkbutton(self.dock, text="Full Color", variable=self.color_mode, onvalue="full", offvalue="grayscale", command=self.debounced_update_preview)
+        self.dock_controls.append(full_toggle)
+        full_palette_combo = ttk.Combobox(self.dock, textvariable=self.full_palette, values=color_dither.PALETTE_OPTIONS, state="readonly", width=18)
+        full_palette_combo.bind("<<ComboboxSelected>>", lambda e: self.debounced_update_preview())
+        add_control("Full Color Palette:", full_palette_combo)
+        # Palette
+        palette_combo = ttk.Combobox(self.dock, textvariable=self.palette, values=palette.PALETTE_OPTIONS, state="readonly", width=18)
+        palette_combo.bind("<<ComboboxSelected>>", lambda e: self.debounced_update_preview())
+        add_control("Palette:", palette_combo)
         # Mono Hue
         self.dock_controls.append(ttk.Label(self.dock, text="Mono Hue:"))
         self.dock_controls.append(ttk.Scale(self.dock, from_=0, to=1, variable=self.hue, orient=tk.HORIZONTAL, command=lambda e: self.debounced_update_preview(), length=100))
+        # Batch worker processes
+        add_control("Workers:", ttk.Spinbox(self.dock, from_=1, to=256, textvariable=self.batch_workers, width=4))
+        # Memory budget for full-resolution saves
+        add_control("Memory (MB):", ttk.Entry(self.dock, textvariable=self.memory_mb, width=6))
+        # Size cap of the on-disk result cache; 0, the default, turns it off
+        add_control("Cache (MB):", ttk.Entry(self.dock, textvariable=self.cache_mb, width=6))
         # File menu dropdown
         file_menu_btn = ttk.Menubutton(self.dock, text="File ▼")
         file_menu = tk.Menu(file_menu_btn, tearoff=0)
         file_menu.add_command(label="Load Image", command=self.load_image)
         file_menu.add_command(label="Save Image", command=self.save_image)
+        file_menu.add_command(label="Export Vector (SVG/PDF)...", command=self.export_vector)
         file_menu.add_command(label="Apply to Folder", command=self.apply_to_folder)
+        file_menu.add_command(label="Dither Frames Folder to GIF...", command=lambda: self.dither_animation(True))
+        file_menu.add_command(label="Dither Animated GIF/PNG...", command=lambda: self.dither_animation(False))
+        file_menu.add_command(label="Save Settings as Preset...", command=self.save_preset)
+        file_menu.add_separator()
+        file_menu.add_command(label="Profile Preview Render...", command=self.profile_render)
         file_menu_btn['menu'] = file_menu
         self.dock_controls.append(file_menu_btn)
+        # Status bar with per-stage timings
+        self.status = ttk.Label(self.dock, text="", width=100, anchor="w")
+        self.dock_controls.append(self.status)
 
         self.dock_relayout_timer = None
         self.relayout_dock()
         self.root.bind('<Configure>', self.debounced_relayout_dock)
         self.root.after(200, self.relayout_dock)  # Force relayout after window is shown
+        self.root.after(30, self.poll_preview)
 
     def add_slider_entry(self, parent, label, var, minv, maxv, default, is_int=False):
         frame = ttk.Frame(parent)
@@ -147,12 +229,11 @@ class DitherDockApp:
         if file_path:
             self.image_path = file_path
             self.image = Image.open(file_path).convert("RGB")
-            # Create a downscaled preview image for UI (max 512x512)
-            preview_size = 512
-            img_w, img_h = self.image.size
-            scale = min(preview_size / img_w, preview_size / img_h, 1.0)
-            self.preview_image = self.image.resize((int(img_w * scale), int(img_h * scale)), Image.LANCZOS)
-            self.update_preview()
+            # Mip pyramid for the viewport; the view starts fitted to the window
+            self.preview_cache.clear()
+            self.preview_key += 1
+            self.pyramid = viewport.MipPyramid(self.image, self.preview_key)
+            self.fit_view()
 
     def save_image(self):
         if self.image is None:
@@ -160,167 +241,184 @@ class DitherDockApp:
             return
         file_path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("PNG files", "*.png")])
         if file_path:
-            # Process the full-res image with current settings and zoom
-            img_w, img_h = self.image.size
-            zoom_factor = self.zoom.get()
-            new_w = int(img_w * zoom_factor)
-            new_h = int(img_h * zoom_factor)
-            save_img = self.image.resize((new_w, new_h), Image.LANCZOS)
-            enhancer = ImageEnhance.Brightness(save_img)
-            bright_img = enhancer.enhance(self.brightness.get())
-            dithered = self.apply_dither(bright_img)
-            dithered.save(file_path)
+            # Process the full-res image with current settings and zoom,
+            # streaming it in strips when it would not fit the memory budget
+            params = self.current_params()
+            memory_mb = self.current_memory_mb()
+            cache, key = self.current_result_cache(), None
+            if cache is not None and self.image_path:
+                hit, key = batch.cache_lookup(cache, self.image_path, file_path, params, "dither")
+                if hit is not None:
+                    self.status.config(text=f"Save: copied from the result cache in {hit.seconds * 1000:.1f}ms")
+                    messagebox.showinfo("Saved", f"Image saved to {file_path}")
+                    return
+            recorder = profiling.StageRecorder()
+            if file_path.lower().endswith(".png") and tiled.needs_tiling(self.image, params, memory_mb):
+                recorder.timed("tiled", tiled.render_to_png, self.image, file_path, params, mode="dither", memory_mb=memory_mb)
+            else:
+                dithered = pipeline.render_dither(self.image, params, recorder)
+                recorder.timed("save", dithered.save, file_path)
+            if key is not None:
+                cache.store(key, os.path.splitext(file_path)[1], file_path)
+                cache.evict()
+            self.status.config(text="Save: " + recorder.summary())
             messagebox.showinfo("Saved", f"Image saved to {file_path}")
 
+    def export_vector(self):
+        if self.image is None:
+            messagebox.showwarning("Warning", "No image to export.")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".svg", filetypes=[("SVG files", "*.svg"), ("PDF files", "*.pdf")])
+        if not file_path:
+            return
+        if not vector_export.is_vector(file_path):
+            messagebox.showerror("Error", "Choose a .svg or .pdf file name.")
+            return
+        # The shape dither of the preview, written as shapes rather than pixels
+        params = self.current_params()
+        cache, key = self.current_result_cache(), None
+        if cache is not None and self.image_path:
+            hit, key = batch.cache_lookup(cache, self.image_path, file_path, params, "shapes")
+            if hit is not None:
+                self.status.config(text=f"Export: copied from the result cache in {hit.seconds * 1000:.1f}ms")
+                messagebox.showinfo("Exported", f"Vector image saved to {file_path}")
+                return
+        recorder = profiling.StageRecorder()
+        count = recorder.timed("vector", vector_export.export, self.image, file_path, params)
+        if key is not None:
+            cache.store(key, os.path.splitext(file_path)[1], file_path)
+            cache.evict()
+        self.status.config(text=f"Export: {count} shapes, " + recorder.summary())
+        messagebox.showinfo("Exported", f"Vector image saved to {file_path}")
+
+    def save_preset(self):
+        # Settings file for watch_folder.py, rendering like Apply to Folder
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+        if file_path:
+            watch_folder.save_preset(file_path, self.current_params())
+            self.status.config(text=f"Preset saved to {file_path}")
+
     def update_preview(self):
-        if self.preview_image is None:
+        if self.pyramid is None:
             return
-        # Resize preview image with zoom
-        canvas_w = self.canvas.winfo_width()
-        canvas_h = self.canvas.winfo_height()
-        img_w, img_h = self.preview_image.size
-        zoom_factor = self.zoom.get()
-        new_w = int(img_w * zoom_factor)
-        new_h = int(img_h * zoom_factor)
-        preview_img = self.preview_image.resize((new_w, new_h), Image.LANCZOS)
-        # Apply brightness, contrast, black clip
-        enhancer = ImageEnhance.Brightness(preview_img)
-        bright_img = enhancer.enhance(self.brightness.get())
-        enhancer2 = ImageEnhance.Contrast(bright_img)
-        contrast_img = enhancer2.enhance(self.contrast.get())
-        arr = np.array(contrast_img.convert("L"))
-        arr[arr < self.black_clip.get()] = 0
-        contrast_img = Image.fromarray(arr).convert("RGB")
-        # Dither with shape
-        dithered = self.apply_shape_dither(contrast_img)
-        self.display_image = ImageTk.PhotoImage(dithered)
+        # Render the visible tiles off the main thread
+        self.preview_renderer.submit(self.pyramid, self.current_params(), self.current_view())
+
+    def current_view(self):
+        canvas_w, canvas_h = max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height())
+        return viewport.View(self.view_fx, self.view_fy, self.current_view_scale(), canvas_w, canvas_h)
+
+    def current_view_scale(self):
+        if self.view_scale is not None:
+            return self.view_scale
+        canvas_w, canvas_h = max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height())
+        return viewport.fit_scale(self.image.size, self.zoom.get(), canvas_w, canvas_h)
+
+    def fit_view(self):
+        self.view_scale = None
+        self.view_fx = self.view_fy = 0.5
+        self.update_preview()
+
+    def zoom_view(self, event, factor):
+        if self.pyramid is None:
+            return
+        # Keep the output point under the pointer where it is
+        out_w, out_h = viewport.output_size(self.image.size, self.zoom.get())
+        view = self.current_view()
+        scale = min(max(view.scale * factor, 0.01), 32.0)
+        dx, dy = event.x - view.width / 2, event.y - view.height / 2
+        self.view_fx += dx * (1 / view.scale - 1 / scale) / max(out_w, 1)
+        self.view_fy += dy * (1 / view.scale - 1 / scale) / max(out_h, 1)
+        self.view_scale = scale
+        self.debounced_update_preview()
+
+    def start_pan(self, event):
+        self.drag_start = (event.x, event.y)
+
+    def pan_view(self, event):
+        if self.pyramid is None or self.drag_start is None:
+            return
+        out_w, out_h = viewport.output_size(self.image.size, self.zoom.get())
+        scale = self.current_view_scale()
+        dx, dy = event.x - self.drag_start[0], event.y - self.drag_start[1]
+        self.drag_start = (event.x, event.y)
+        self.view_scale = scale
+        self.view_fx = min(max(self.view_fx - dx / (scale * max(out_w, 1)), 0.0), 1.0)
+        self.view_fy = min(max(self.view_fy - dy / (scale * max(out_h, 1)), 0.0), 1.0)
+        # Move the current frame at once; the re-render fills in the edges
+        self.canvas.move("view", dx, dy)
+        self.debounced_update_preview()
+
+    def poll_preview(self):
+        frame = self.preview_renderer.latest()
+        if frame is not None:
+            image, final, recorder = frame
+            if isinstance(image, Exception):
+                self.status.config(text=f"Preview failed: {image}")
+            else:
+                self.show_preview(image, recorder)
+                self.status.config(text=("Preview: " if final else "Quick preview: ") + recorder.summary())
+        self.root.after(30, self.poll_preview)
+
+    def show_preview(self, dithered, recorder):
+        self.display_image = recorder.timed("photo", ImageTk.PhotoImage, dithered)
         self.canvas.delete("all")
-        self.canvas.create_image(canvas_w // 2, canvas_h // 2, anchor=tk.CENTER, image=self.display_image)
-
-    def apply_dither(self, img):
-        arr = np.array(img.convert("L"))
-        algo = self.dither_algorithm.get()
-        threshold = self.dither_strength.get()
-        if algo == "Floyd-Steinberg":
-            arr = self.floyd_steinberg(arr, threshold)
-        elif algo == "Ordered":
-            arr = self.ordered_dither(arr)
-        elif algo == "Atkinson":
-            arr = self.atkinson_dither(arr, threshold)
-        out_img = Image.fromarray(arr).convert("L")
-        if self.color_mode.get() == "color":
-            # Apply mono hue
-            hue = self.hue.get()
-            rgb_img = Image.new("RGB", out_img.size)
-            arr = np.array(out_img)
-            for y in range(out_img.size[1]):
-                for x in range(out_img.size[0]):
-                    v = arr[y, x] / 255.0
-                    r, g, b = colorsys.hsv_to_rgb(hue, 1, v)
-                    rgb_img.putpixel((x, y), (int(r*255), int(g*255), int(b*255)))
-            return rgb_img
-        return out_img
-
-    def floyd_steinberg(self, arr, threshold):
-        arr = arr.astype(float)
-        h, w = arr.shape
-        for y in range(h):
-            for x in range(w):
-                old = arr[y, x]
-                new = 255 if old > threshold else 0
-                arr[y, x] = new
-                err = old - new
-                if x+1<w: arr[y, x+1] += err*7/16
-                if x-1>=0 and y+1<h: arr[y+1, x-1] += err*3/16
-                if y+1<h: arr[y+1, x] += err*5/16
-                if x+1<w and y+1<h: arr[y+1, x+1] += err*1/16
-        return np.clip(arr,0,255).astype(np.uint8)
-
-    def ordered_dither(self, arr):
-        bayer = np.array([[0,2],[3,1]])
-        bayer = np.kron(bayer, np.ones((arr.shape[0]//2, arr.shape[1]//2)))
-        bayer = bayer[:arr.shape[0], :arr.shape[1]]
-        threshold_map = (bayer+0.5)*255/4
-        return np.where(arr>threshold_map,255,0).astype(np.uint8)
-
-    def atkinson_dither(self, arr, threshold):
-        arr = arr.astype(float)
-        h, w = arr.shape
-        for y in range(h):
-            for x in range(w):
-                old = arr[y, x]
-                new = 255 if old > threshold else 0
-                arr[y, x] = new
-                err = (old - new)/8
-                for dx, dy in [(1,0),(2,0),(-1,1),(0,1),(1,1),(0,2)]:
-                    nx, ny = x+dx, y+dy
-                    if 0<=nx<w and 0<=ny<h:
-                        arr[ny, nx] += err
-        return np.clip(arr,0,255).astype(np.uint8)
-
-    def apply_shape_dither(self, img):
-        arr = np.array(img.convert("L"))
-        shape = self.shape.get()
-        dot_size = self.dot_size.get()
-        detail = self.detail.get()
-        threshold = self.dither_strength.get()
-        h, w = arr.shape
-        out = Image.new("RGB", (w, h), (0,0,0))
-        draw = ImageDraw.Draw(out)
-        rng = np.random.default_rng(42)
-        for y in range(0, h, detail):
-            for x in range(0, w, detail):
-                block = arr[y:y+detail, x:x+detail]
-                avg = np.mean(block)
-                if avg < threshold:
-                    continue
-                # Dot size proportional to brightness (larger = brighter)
-                rel = (avg - threshold) / (255 - threshold) if avg > threshold else 0
-                rel = max(0, min(1, rel))
-                size = int(1 + rel * (dot_size-1))
-                cx, cy = x + detail//2, y + detail//2
-                if shape.startswith("Circle"):
-                    draw.ellipse([cx-size//2, cy-size//2, cx+size//2, cy+size//2], fill=(255,255,255))
-                elif shape.startswith("Square"):
-                    angle = 0
-                    if "random" in shape.lower():
-                        angle = rng.uniform(0, 360)
-                    self.draw_square(draw, cx, cy, size, angle)
-                elif shape.startswith("Triangle"):
-                    angle = 0
-                    if "random" in shape.lower():
-                        angle = rng.uniform(0, 360)
-                    self.draw_triangle(draw, cx, cy, size, angle)
-        if self.color_mode.get() == "color":
-            # Apply mono hue
-            hue = self.hue.get()
-            arr = np.array(out.convert("L"))
-            rgb_img = Image.new("RGB", out.size)
-            for y in range(out.size[1]):
-                for x in range(out.size[0]):
-                    v = arr[y, x] / 255.0
-                    r, g, b = colorsys.hsv_to_rgb(hue, 1, v)
-                    rgb_img.putpixel((x, y), (int(r*255), int(g*255), int(b*255)))
-            return rgb_img
-        return out
-
-    def draw_square(self, draw, cx, cy, size, angle):
-        rad = math.radians(angle)
-        half = size/2
-        corners = [
-            (cx + half*math.cos(rad + math.pi/4*i), cy + half*math.sin(rad + math.pi/4*i))
-            for i in range(4)
-        ]
-        draw.polygon(corners, fill=(255,255,255))
-
-    def draw_triangle(self, draw, cx, cy, size, angle):
-        rad = math.radians(angle)
-        half = size/2
-        corners = [
-            (cx + half*math.cos(rad + 2*math.pi/3*i), cy + half*math.sin(rad + 2*math.pi/3*i))
-            for i in range(3)
-        ]
-        draw.polygon(corners, fill=(255,255,255))
+        self.canvas.create_image(0, 0, anchor=tk.NW, image=self.display_image, tags="view")
+
+    def profile_render(self):
+        if self.pyramid is None:
+            messagebox.showwarning("Warning", "Load an image to profile.")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".prof", filetypes=[("Profile", "*.prof")], title="Save Profile As")
+        if file_path:
+            # One uncached render of the current view under cProfile and tracemalloc
+            recorder = profiling.StageRecorder()
+            profiling.capture(file_path, viewport.render_view, self.pyramid, self.current_params(), self.current_view(), recorder)
+            self.status.config(text="Profiled: " + recorder.summary())
+            messagebox.showinfo("Profile Saved", f"Profile written to {file_path}\nSummary in {file_path}.txt")
+
+    def current_params(self):
+        # Snapshot of the dock settings for the processing pipeline
+        return pipeline.DitherParams(
+            brightness=self.brightness.get(),
+            contrast=self.contrast.get(),
+            black_clip=self.black_clip.get(),
+            gamma=self.gamma.get(),
+            levels_low=self.levels_low.get(),
+            levels_high=self.levels_high.get(),
+            curve=self.current_curve(),
+            algorithm=self.dither_algorithm.get(),
+            threshold=self.dither_strength.get(),
+            serpentine=self.serpentine.get(),
+            threshold_map=self.threshold_map.get(),
+            dot_size=self.dot_size.get(),
+            detail=self.detail.get(),
+            shape=self.shape.get(),
+            zoom=self.zoom.get(),
+            color_mode=self.color_mode.get(),
+            hue=self.hue.get(),
+            palette=self.palette.get(),
+            full_palette=self.full_palette.get(),
+        )
+
+    def current_memory_mb(self):
+        try:
+            return max(16, self.memory_mb.get())
+        except (tk.TclError, ValueError):
+            return MEMORY_MB
+
+    def current_result_cache(self):
+        try:
+            cache_mb = self.cache_mb.get()
+        except (tk.TclError, ValueError):
+            cache_mb = 0
+        return result_cache.ResultCache(max_mb=cache_mb) if cache_mb > 0 else None
+
+    def current_curve(self):
+        try:
+            return tone.parse_curve(self.curve.get())
+        except ValueError:
+            return ()
 
     def apply_to_folder(self):
         input_dir = filedialog.askdirectory(title="Select Input Folder")
@@ -330,58 +428,129 @@ class DitherDockApp:
         if not output_dir:
             return
         # Gather all image files
-        image_exts = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff'}
-        files = [f for f in os.listdir(input_dir) if os.path.splitext(f)[1].lower() in image_exts]
-        if not files:
+        jobs = batch.folder_jobs(input_dir, output_dir)
+        if not jobs:
             messagebox.showwarning("No Images", "No image files found in the selected folder.")
             return
         # Progress window
         progress_win = tk.Toplevel(self.root)
         progress_win.title("Batch Dithering")
-        progress_win.geometry("400x120")
+        progress_win.geometry("420x300")
         progress_label = ttk.Label(progress_win, text="Processing images...")
         progress_label.pack(pady=10)
-        progress_bar = ttk.Progressbar(progress_win, length=350, mode='determinate', maximum=len(files))
+        progress_bar = ttk.Progressbar(progress_win, length=350, mode='determinate', maximum=len(jobs))
         progress_bar.pack(pady=10)
-        status_label = ttk.Label(progress_win, text="0 / {}".format(len(files)))
+        status_label = ttk.Label(progress_win, text="0 / {}".format(len(jobs)))
+        status_label.pack(pady=5)
+        cancel = threading.Event()
+        cancel_btn = ttk.Button(progress_win, text="Cancel", command=cancel.set)
+        cancel_btn.pack(pady=5)
+        error_list = tk.Listbox(progress_win, height=6)
+        error_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        progress_win.protocol("WM_DELETE_WINDOW", cancel.set)
+        events = queue.Queue()
+        try:
+            workers = max(1, int(self.batch_workers.get()))
+        except (tk.TclError, ValueError):
+            workers = 1
+        # The pool runs off the main thread; results come back through the queue
+        threading.Thread(target=batch.run, args=(jobs, self.current_params()),
+                         kwargs=dict(workers=workers, events=events, cancel=cancel, cache=self.current_result_cache(),
+                                     memory_mb=self.current_memory_mb(), log_path=os.path.join(output_dir, "dither_batch_log.jsonl")), daemon=True).start()
+        def poll():
+            summary = None
+            try:
+                while True:
+                    kind, result, summary = events.get_nowait()
+                    if kind == "result" and result.error:
+                        error_list.insert(tk.END, f"{os.path.basename(result.src)}: {result.error}")
+                    if kind == "finished":
+                        return finish(summary)
+            except queue.Empty:
+                pass
+            if summary is not None:
+                progress_bar['value'] = summary.done
+                status_label.config(text=f"{summary.done} / {summary.total}, {summary.files_per_s:.1f} files/s, {summary.mp_per_s:.1f} MP/s")
+            if cancel.is_set():
+                progress_label.config(text="Cancelling...")
+            self.root.after(50, poll)
+        def finish(summary):
+            processed = summary.done - len(summary.errors)
+            self.status.config(text=f"Batch: {summary.files_per_s:.1f} files/s, {summary.mp_per_s:.1f} MP/s; stage timings in dither_batch_log.jsonl")
+            text = f"Processed {processed} of {summary.total} images in {summary.elapsed:.1f}s ({summary.files_per_s:.1f} files/s, {summary.mp_per_s:.1f} MP/s)."
+            if summary.cache_hits or summary.cache_misses:
+                text += f"\n{summary.cache_hits} copied from the result cache, {summary.cache_misses} rendered."
+            if summary.cancelled:
+                text = "Cancelled. " + text
+            if summary.errors:
+                text += f"\n{len(summary.errors)} failed; see the list in the progress window."
+                progress_bar['value'] = summary.done
+                status_label.config(text=f"{summary.done} / {summary.total}")
+                progress_label.config(text="Finished with errors")
+                cancel_btn.config(text="Close", command=progress_win.destroy)
+                progress_win.protocol("WM_DELETE_WINDOW", progress_win.destroy)
+                messagebox.showwarning("Done", text, parent=progress_win)
+            else:
+                progress_win.destroy()
+                messagebox.showinfo("Done", text)
+        poll()
+
+    def dither_animation(self, from_folder):
+        if from_folder:
+            source = filedialog.askdirectory(title="Select Folder of Frames")
+        else:
+            source = filedialog.askopenfilename(title="Select Animation", filetypes=[("Animations", "*.gif *.png *.apng *.webp")])
+        if not source:
+            return
+        output = filedialog.asksaveasfilename(defaultextension=".gif", filetypes=[("GIF files", "*.gif")], title="Save GIF As")
+        if not output:
+            return
+        # Frames are dithered with the current settings and encoded straight
+        # into the GIF; progress comes back through the queue
+        progress_win = tk.Toplevel(self.root)
+        progress_win.title("Dithering Animation")
+        progress_win.geometry("360x140")
+        progress_bar = ttk.Progressbar(progress_win, length=300, mode='determinate')
+        progress_bar.pack(pady=15)
+        status_label = ttk.Label(progress_win, text="Starting...")
         status_label.pack(pady=5)
-        self.root.update()
-        def batch_process():
-            for i, fname in enumerate(files):
-                try:
-                    img_path = os.path.join(input_dir, fname)
-                    img = Image.open(img_path).convert("RGB")
-                    # Apply zoom
-                    img_w, img_h = img.size
-                    zoom_factor = self.zoom.get()
-                    new_w = int(img_w * zoom_factor)
-                    new_h = int(img_h * zoom_factor)
-                    proc_img = img.resize((new_w, new_h), Image.LANCZOS)
-                    # Apply brightness
-                    enhancer = ImageEnhance.Brightness(proc_img)
-                    bright_img = enhancer.enhance(self.brightness.get())
-                    # Apply contrast
-                    enhancer2 = ImageEnhance.Contrast(bright_img)
-                    contrast_img = enhancer2.enhance(self.contrast.get())
-                    # Apply black clip
-                    arr = np.array(contrast_img.convert("L"))
-                    arr[arr < self.black_clip.get()] = 0
-                    contrast_img = Image.fromarray(arr).convert("RGB")
-                    # Apply shape dither
-                    dithered = self.apply_shape_dither(contrast_img)
-                    name, ext = os.path.splitext(fname)
-                    out_path = os.path.join(output_dir, f"{name}_dithered{ext}")
-                    dithered.save(out_path)
-                except Exception as e:
-                    print(f"Error processing {fname}: {e}")
-                progress_bar['value'] = i+1
-                status_label.config(text=f"{i+1} / {len(files)}")
-                self.root.update()
-            progress_win.destroy()
-            messagebox.showinfo("Done", f"Processed {len(files)} images.")
-        threading.Thread(target=batch_process).start()
-
-    def debounced_update_preview(self, delay=100):
+        cancel = threading.Event()
+        ttk.Button(progress_win, text="Cancel", command=cancel.set).pack(pady=5)
+        progress_win.protocol("WM_DELETE_WINDOW", cancel.set)
+        events = queue.Queue()
+
+        def work(params):
+            try:
+                progress = lambda done, total: events.put(("progress", done, total))
+                events.put(("done", animation.dither_animation(source, output, params, progress=progress, cancel=cancel), None))
+            except Exception as e:
+                events.put(("error", e, None))
+        threading.Thread(target=work, args=(self.current_params(),), daemon=True).start()
+
+        def poll():
+            try:
+                while True:
+                    kind, a, b = events.get_nowait()
+                    if kind == "progress":
+                        progress_bar.config(maximum=b, value=a)
+                        status_label.config(text=f"Frame {a} / {b}")
+                        continue
+                    progress_win.destroy()
+                    if kind == "error":
+                        messagebox.showerror("Error", f"Failed to dither animation: {a}")
+                        return
+                    self.status.config(text=f"Animation: {a.frames} frames in {a.seconds:.1f}s, {a.reuse:.0%} of tiles reused")
+                    text = f"Wrote {a.written} frames to {output}"
+                    if a.dropped:
+                        text += f" ({a.dropped} repeated frames merged)"
+                    messagebox.showinfo("Cancelled" if a.cancelled else "Done", text)
+                    return
+            except queue.Empty:
+                pass
+            self.root.after(50, poll)
+        poll()
+
+    def debounced_update_preview(self, delay=30):
         if hasattr(self, 'debounce_timer') and self.debounce_timer:
             self.root.after_cancel(self.debounce_timer)
         self.debounce_timer = self.root.after(delay, self.update_preview)
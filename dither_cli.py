@@ -0,0 +1,124 @@
+import argparse
+import glob
+import os
+import sys
+from dataclasses import fields
+import animation
+import batch
+import color_dither
+import palette
+import pipeline
+import profiling
+import result_cache
+import threshold_maps
+import tone
+import vector_export
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="dither", description="Dither images without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="image files or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="output folder, or output file for a single input")
+    parser.add_argument("--mode", choices=sorted(batch.RENDERERS), default="shapes",
+                        help="shapes: shape dither like the preview and Apply to Folder; dither: algorithm dither like Save Image")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument("--vector", choices=sorted(e[1:] for e in vector_export.EXTS),
+                        help="write shapes as SVG or PDF files into an output folder (a single .svg/.pdf -o does this too)")
+    parser.add_argument("--memory-mb", type=float, help="stream large PNG outputs in strips within this memory budget")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse results rendered before with the same source and settings (keeps a copy of every output on disk)")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", help="always render, the default")
+    parser.add_argument("--cache-dir", help="result cache folder (default: %s)" % result_cache.default_dir())
+    parser.add_argument("--cache-mb", type=float, default=result_cache.DEFAULT_MB, help="result cache size cap")
+    parser.add_argument("--log", help="append per-file stage timings to this JSON lines file")
+    parser.add_argument("--profile", metavar="PATH", help="profile rendering the first input with cProfile and tracemalloc, then exit")
+    parser.add_argument("--animate", action="store_true",
+                        help="dither one folder of frames or animated GIF/PNG into the animated GIF given by -o")
+    parser.add_argument("--frame-ms", type=int, default=animation.FRAME_MS, help="frame duration for folders of frames")
+    parser.add_argument("--keep-duplicates", action="store_true", help="keep repeated output frames instead of merging them")
+    defaults = pipeline.DitherParams()
+    parser.add_argument("--brightness", type=float, default=defaults.brightness)
+    parser.add_argument("--contrast", type=float, default=defaults.contrast)
+    parser.add_argument("--black-clip", type=int, default=defaults.black_clip)
+    parser.add_argument("--gamma", type=float, default=defaults.gamma)
+    parser.add_argument("--levels-low", type=int, default=defaults.levels_low)
+    parser.add_argument("--levels-high", type=int, default=defaults.levels_high)
+    parser.add_argument("--curve", type=tone.parse_curve, default=defaults.curve, help='tone curve points, e.g. "0,0 128,96 255,255"')
+    parser.add_argument("--algorithm", choices=pipeline.ALGORITHMS, default=defaults.algorithm)
+    parser.add_argument("--threshold", type=int, default=defaults.threshold)
+    parser.add_argument("--serpentine", action="store_true")
+    parser.add_argument("--threshold-map", choices=threshold_maps.MAP_OPTIONS, default=defaults.threshold_map)
+    parser.add_argument("--dot-size", type=int, default=defaults.dot_size)
+    parser.add_argument("--detail", type=int, default=defaults.detail)
+    parser.add_argument("--shape", choices=pipeline.SHAPES, default=defaults.shape)
+    parser.add_argument("--zoom", type=float, default=defaults.zoom)
+    parser.add_argument("--color", dest="color_mode", action="store_const", const="color", default=defaults.color_mode)
+    parser.add_argument("--hue", type=float, default=defaults.hue)
+    parser.add_argument("--palette", choices=palette.PALETTE_OPTIONS, default=defaults.palette)
+    parser.add_argument("--full-color", dest="color_mode", action="store_const", const="full",
+                        help="with --mode dither, dither the RGB channels to --full-palette instead of colorizing gray")
+    parser.add_argument("--full-palette", choices=color_dither.PALETTE_OPTIONS, default=defaults.full_palette)
+    return parser
+
+def params_from_args(args):
+    return pipeline.DitherParams(**{f.name: getattr(args, f.name) for f in fields(pipeline.DitherParams)})
+
+def expand_inputs(patterns):
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        files.extend(f for f in matches if os.path.splitext(f)[1].lower() in pipeline.IMAGE_EXTS)
+    return files
+
+def output_path(src, output, single, vector=None):
+    if single and not os.path.isdir(output):
+        return output
+    name, ext = os.path.splitext(os.path.basename(src))
+    return os.path.join(output, f"{name}_dithered.{vector}" if vector else f"{name}_dithered{ext}")
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    params = params_from_args(args)
+    if args.animate:
+        return animate(args, params)
+    files = expand_inputs(args.inputs)
+    if not files:
+        print("No image files found.", file=sys.stderr)
+        return 1
+    single = len(files) == 1 and os.path.splitext(args.output)[1] != ""
+    if not single:
+        os.makedirs(args.output, exist_ok=True)
+    jobs = [(src, output_path(src, args.output, single, args.vector)) for src in files]
+    if args.profile:
+        result = profiling.capture(args.profile, batch.process_file, *jobs[0], params, args.mode, args.memory_mb)
+        print(f"Profile written to {args.profile} and {args.profile}.txt")
+        print("  ".join(f"{r['stage']} {r['seconds'] * 1000:.1f}ms" for r in result.stages))
+        return 1 if result.error else 0
+    cache = result_cache.ResultCache(args.cache_dir, args.cache_mb) if args.cache else None
+    summary = batch.run(jobs, params, workers=args.workers, mode=args.mode, memory_mb=args.memory_mb, log_path=args.log, cache=cache)
+    for src, error in summary.errors:
+        print(f"Error processing {src}: {error}", file=sys.stderr)
+    print(f"Processed {summary.done - len(summary.errors)} / {summary.total} images in {summary.elapsed:.2f}s "
+          f"({summary.files_per_s:.1f} files/s, {summary.mp_per_s:.1f} MP/s)")
+    if cache is not None:
+        print(f"Result cache: {summary.cache_hits} hits, {summary.cache_misses} misses")
+    return 1 if summary.errors else 0
+
+def animate(args, params):
+    if len(args.inputs) != 1 or not os.path.exists(args.inputs[0]):
+        print("--animate takes one folder of frames or one animated image.", file=sys.stderr)
+        return 1
+    try:
+        summary = animation.dither_animation(args.inputs[0], args.output, params, args.mode, args.frame_ms,
+                                             drop_duplicates=not args.keep_duplicates, workers=args.workers)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if not summary.frames:
+        print("No frames found.", file=sys.stderr)
+        return 1
+    print(f"Dithered {summary.frames} frames in {summary.seconds:.2f}s, {summary.reuse:.0%} of tiles reused; "
+          f"wrote {summary.written} frames ({summary.dropped} duplicates merged) to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
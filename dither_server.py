@@ -0,0 +1,376 @@
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+import batch
+import color_dither
+import palette
+import pipeline
+import shapes
+import threshold_maps
+import tone
+
+PORT = 8765
+BATCH_MAX = 8
+SMALL_BYTES = 1 << 20  # larger uploads are rendered on their own, never batched
+MAX_QUEUE = 256
+MAX_BODY_MB = 64
+MAX_MEGAPIXELS = 100
+MAX_DOT_SIZE = 12  # the dock's slider ranges; larger values would build huge stamps
+MAX_DETAIL = 64
+LATENCY_WINDOW = 2048
+CHOICES = dict(algorithm=pipeline.ALGORITHMS, shape=pipeline.SHAPES, threshold_map=threshold_maps.MAP_OPTIONS,
+               palette=palette.PALETTE_OPTIONS, color_mode=["grayscale", "color", "full"],
+               full_palette=color_dither.PALETTE_OPTIONS)
+
+class Overloaded(Exception):
+    pass
+
+def parse_params(query):
+    # (DitherParams, mode) from URL query values such as
+    # "mode=dither&algorithm=Atkinson&zoom=2", each converted to the type of
+    # the field's default. Raises ValueError on anything unknown or invalid.
+    values = {name: v[-1] for name, v in parse_qs(query, strict_parsing=bool(query)).items()}
+    mode = values.pop("mode", "shapes")
+    if mode not in batch.RENDERERS:
+        raise ValueError(f"Unknown mode: {mode}")
+    defaults = pipeline.DitherParams()
+    names = {f.name for f in fields(pipeline.DitherParams)}
+    kwargs = {}
+    for name, value in values.items():
+        if name not in names:
+            raise ValueError(f"Unknown setting: {name}")
+        default = getattr(defaults, name)
+        if name == "curve":
+            kwargs[name] = tone.parse_curve(value)
+        elif isinstance(default, bool):
+            kwargs[name] = value.lower() in ("1", "true", "yes", "on")
+        else:
+            kwargs[name] = type(default)(value)
+        if name in CHOICES and kwargs[name] not in CHOICES[name]:
+            raise ValueError(f"Unknown {name}: {value}")
+    params = pipeline.DitherParams(**kwargs)
+    if not 1 <= params.detail <= MAX_DETAIL:
+        raise ValueError(f"detail must be between 1 and {MAX_DETAIL}")
+    if not 1 <= params.dot_size <= MAX_DOT_SIZE:
+        raise ValueError(f"dot_size must be between 1 and {MAX_DOT_SIZE}")
+    if not params.zoom > 0:
+        raise ValueError("zoom must be positive")
+    return params, mode
+
+def warm():
+    # Pool initializer: every threshold map, every shape stamp the dock can
+    # ask for and the compiled error diffusion backend are ready before the
+    # first request
+    for name in threshold_maps.MAP_OPTIONS:
+        threshold_maps.threshold_map(name)
+    for kind in ("circle", "square", "triangle"):
+        for size in range(1, MAX_DOT_SIZE + 1):
+            for angle in range(1 if kind == "circle" else shapes.ANGLE_STEPS):
+                shapes.stamp(kind, size, angle)
+    sample = Image.linear_gradient("L").resize((64, 64)).convert("RGB")
+    pipeline.render_dither(sample, pipeline.DitherParams())
+
+def render_request(data, params, mode, max_megapixels=MAX_MEGAPIXELS):
+    # (HTTP status, body): PNG bytes, or an error message
+    try:
+        img = Image.open(io.BytesIO(data))
+        if img.width * img.height * params.zoom ** 2 > max_megapixels * 1e6:
+            return 413, f"Output would exceed {max_megapixels} MP".encode()
+        out = batch.RENDERERS[mode](img.convert("RGB"), params)
+        buf = io.BytesIO()
+        out.save(buf, "PNG")
+        return 200, buf.getvalue()
+    except Image.DecompressionBombError as e:
+        return 413, str(e).encode()
+    except (UnidentifiedImageError, ValueError, OSError) as e:
+        return 400, f"{type(e).__name__}: {e}".encode()
+    except Exception as e:
+        return 500, f"{type(e).__name__}: {e}".encode()
+
+def render_batch(jobs, max_megapixels=MAX_MEGAPIXELS):
+    # One pool task for several requests, so small images share the cost of
+    # a round trip to the worker
+    return [render_request(data, params, mode, max_megapixels) for data, params, mode in jobs]
+
+class Job:
+    __slots__ = ("data", "params", "mode", "start", "future")
+
+    def __init__(self, data, params, mode):
+        self.data, self.params, self.mode = data, params, mode
+        self.start = time.perf_counter()
+        self.future = Future()
+
+class DitherService:
+    # Requests wait in a queue for a free worker slot. A dispatcher thread
+    # hands them to a warm process pool: whatever small requests are waiting
+    # when a slot frees up (up to batch_max, after at most batch_ms for more
+    # to arrive) go as one task. An idle service therefore adds no delay,
+    # and a busy one batches. Beyond max_queue waiting requests submit()
+    # raises Overloaded. A worker that dies (killed, out of memory) breaks
+    # the pool; the requests it held fail and a new pool takes over.
+    def __init__(self, workers=None, batch_max=BATCH_MAX, batch_ms=0.0, max_queue=MAX_QUEUE, max_megapixels=MAX_MEGAPIXELS):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.batch_max, self.batch_window = max(1, batch_max), batch_ms / 1000
+        self.max_queue, self.max_megapixels = max_queue, max_megapixels
+        self.pool = self.start_pool()
+        self.pool_lock = threading.Lock()
+        self.slots = threading.Semaphore(self.workers * 2)
+        self.waiting = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.started = time.time()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counts = dict(requests=0, ok=0, client_errors=0, server_errors=0, rejected=0, batches=0, batched_requests=0,
+                           pool_restarts=0)
+        self.in_flight = 0
+        # Start every worker now rather than on the first requests
+        for future in [self.pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def start_pool(self):
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=warm)
+
+    def restart_pool(self, broken):
+        # Replace a broken pool once, however many of its futures report it
+        with self.pool_lock:
+            if self.pool is not broken or self.closed:
+                return
+            self.pool = self.start_pool()
+        with self.cond:
+            self.counts["pool_restarts"] += 1
+        broken.shutdown(wait=False)
+
+    def pool_submit(self, fn, *args):
+        # (pool, future). A pool found broken here is replaced and the task
+        # goes to the new one.
+        for _ in range(2):
+            pool = self.pool
+            try:
+                return pool, pool.submit(fn, *args)
+            except BrokenProcessPool as e:
+                self.restart_pool(pool)
+                error = e
+            except RuntimeError as e:  # shut down
+                error = e
+                break
+        future = Future()
+        future.set_exception(error)
+        return pool, future
+
+    def health(self):
+        # (ok, message). Submitting to a pool with a dead worker fails at once,
+        # so this notices a crash even while idle, and starts the replacement.
+        if self.closed:
+            return False, "shutting down"
+        pool = self.pool
+        try:
+            pool.submit(os.getpid)
+        except BrokenProcessPool:
+            self.restart_pool(pool)
+            return False, "worker pool broken; restarting"
+        except RuntimeError:
+            return False, "worker pool shut down"
+        return True, "ok"
+
+    def submit(self, data, params, mode="shapes"):
+        job = Job(data, params, mode)
+        with self.cond:
+            self.counts["requests"] += 1
+            if self.closed or len(self.waiting) >= self.max_queue:
+                self.counts["rejected"] += 1
+                raise Overloaded("Too many queued requests")
+            self.waiting.append(job)
+            self.cond.notify()
+        return job.future
+
+    def next_batch(self):
+        # First waiting job plus the small ones queued behind it
+        with self.cond:
+            while not self.waiting and not self.closed:
+                self.cond.wait()
+            if not self.waiting:
+                return []
+            jobs = [self.waiting.popleft()]
+            if len(jobs[0].data) >= SMALL_BYTES:
+                return jobs
+            deadline = time.perf_counter() + self.batch_window
+            while len(jobs) < self.batch_max:
+                if not self.waiting:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0 or self.closed:
+                        break
+                    self.cond.wait(remaining)
+                    continue
+                if len(self.waiting[0].data) >= SMALL_BYTES:
+                    break
+                jobs.append(self.waiting.popleft())
+            return jobs
+
+    def dispatch(self):
+        while True:
+            self.slots.acquire()
+            jobs = self.next_batch()
+            if not jobs:
+                self.slots.release()
+                return
+            with self.cond:
+                self.in_flight += len(jobs)
+                self.counts["batches"] += 1
+                self.counts["batched_requests"] += len(jobs)
+            pool, future = self.pool_submit(render_batch, [(job.data, job.params, job.mode) for job in jobs],
+                                            self.max_megapixels)
+            future.add_done_callback(lambda f, pool=pool, jobs=jobs: self.complete(f, pool, jobs))
+
+    def complete(self, future, pool, jobs):
+        self.slots.release()
+        try:
+            replies = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self.restart_pool(pool)
+            replies = [(500, f"{type(e).__name__}: {e}".encode())] * len(jobs)
+        now = time.perf_counter()
+        with self.cond:
+            self.in_flight -= len(jobs)
+            for job, (status, _) in zip(jobs, replies):
+                self.latencies.append(now - job.start)
+                key = "ok" if status == 200 else "client_errors" if status < 500 else "server_errors"
+                self.counts[key] += 1
+        for job, reply in zip(jobs, replies):
+            job.future.set_result(reply)
+
+    def metrics(self):
+        with self.cond:
+            latencies = np.array(self.latencies) * 1000
+            counts = dict(self.counts)
+            depth, in_flight = len(self.waiting), self.in_flight
+        uptime = time.time() - self.started
+        percentiles = {f"p{q}": round(float(np.percentile(latencies, q)), 3) if len(latencies) else None for q in (50, 90, 99)}
+        return dict(counts, queue_depth=depth, in_flight=in_flight, workers=self.workers, uptime_s=round(uptime, 3),
+                    requests_per_s=round(counts["ok"] / uptime, 3) if uptime else 0.0,
+                    mean_batch=round(counts["batched_requests"] / counts["batches"], 3) if counts["batches"] else None,
+                    latency_ms=dict(percentiles, max=round(float(latencies.max()), 3) if len(latencies) else None,
+                                    window=len(latencies)))
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.dispatcher.join()
+        with self.pool_lock:
+            pool = self.pool
+        pool.shutdown(cancel_futures=True)
+
+class Handler(BaseHTTPRequestHandler):
+    # POST /dither with the image file as the body and settings in the query
+    # string answers with the dithered PNG; GET /metrics and GET /health
+    protocol_version = "HTTP/1.1"
+
+    def reply(self, status, content_type, body, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def error(self, status, message, headers=()):
+        self.reply(status, "text/plain; charset=utf-8", (message + "\n").encode(), headers)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/metrics":
+            self.reply(200, "application/json", json.dumps(self.server.service.metrics()).encode())
+        elif path == "/health":
+            ok, message = self.server.service.health()
+            self.error(200 if ok else 503, message)
+        else:
+            self.error(404, "Not found")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/dither":
+            self.error(404, "Not found")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            self.error(411, "Send the image as the request body with a Content-Length")
+            return
+        if length > self.server.max_body:
+            self.close_connection = True
+            self.error(413, f"Request body is over {self.server.max_body // 2**20} MB")
+            return
+        data = self.rfile.read(length)
+        try:
+            params, mode = parse_params(url.query)
+        except ValueError as e:
+            self.error(400, str(e))
+            return
+        try:
+            status, body = self.server.service.submit(data, params, mode).result()
+        except Overloaded as e:
+            self.error(503, str(e), [("Retry-After", "1")])
+            return
+        if status == 200:
+            self.reply(200, "image/png", body)
+        else:
+            self.error(status, body.decode(errors="replace"))
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class DitherHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the default of 5 resets connections under load
+
+def serve(host="127.0.0.1", port=PORT, workers=None, batch_max=BATCH_MAX, batch_ms=0.0, max_queue=MAX_QUEUE,
+          max_body_mb=MAX_BODY_MB, max_megapixels=MAX_MEGAPIXELS, verbose=False):
+    service = DitherService(workers, batch_max, batch_ms, max_queue, max_megapixels)
+    httpd = DitherHTTPServer((host, port), Handler)
+    httpd.service, httpd.verbose, httpd.max_body = service, verbose, int(max_body_mb * 2**20)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown).start())
+    print(f"Serving on http://{host}:{httpd.server_address[1]} with {service.workers} workers")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve dithering over HTTP on this machine.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: local connections only)")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument("--batch-max", type=int, default=BATCH_MAX, help="most small requests sent to a worker as one task")
+    parser.add_argument("--batch-ms", type=float, default=0.0, help="how long a batch waits for more requests once a worker is free")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE, help="queued requests before answering 503")
+    parser.add_argument("--max-body-mb", type=float, default=MAX_BODY_MB, help="largest accepted upload")
+    parser.add_argument("--max-megapixels", type=float, default=MAX_MEGAPIXELS, help="largest output image")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers, args.batch_max, args.batch_ms, args.max_queue, args.max_body_mb,
+          args.max_megapixels, args.verbose)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Each kernel is (divisor, [(dx, dy, weight), ...]); error is pushed to (x+dx, y+dy)
+KERNELS = {
+    "Floyd-Steinberg": (16, [(1, 0, 7), (-1, 1, 3), (0, 1, 5), (1, 1, 1)]),
+    "Atkinson": (8, [(1, 0, 1), (2, 0, 1), (-1, 1, 1), (0, 1, 1), (1, 1, 1), (0, 2, 1)]),
+    "Jarvis-Judice-Ninke": (48, [
+        (1, 0, 7), (2, 0, 5),
+        (-2, 1, 3), (-1, 1, 5), (0, 1, 7), (1, 1, 5), (2, 1, 3),
+        (-2, 2, 1), (-1, 2, 3), (0, 2, 5), (1, 2, 3), (2, 2, 1)]),
+    "Stucki": (42, [
+        (1, 0, 8), (2, 0, 4),
+        (-2, 1, 2), (-1, 1, 4), (0, 1, 8), (1, 1, 4), (2, 1, 2),
+        (-2, 2, 1), (-1, 2, 2), (0, 2, 4), (1, 2, 2), (2, 2, 1)]),
+    "Burkes": (32, [
+        (1, 0, 8), (2, 0, 4),
+        (-2, 1, 2), (-1, 1, 4), (0, 1, 8), (1, 1, 4), (2, 1, 2)]),
+    "Sierra": (32, [
+        (1, 0, 5), (2, 0, 3),
+        (-2, 1, 2), (-1, 1, 4), (0, 1, 5), (1, 1, 4), (2, 1, 2),
+        (-1, 2, 2), (0, 2, 3), (1, 2, 2)]),
+}
+
+# numba: compiled per-pixel loop. wavefront: NumPy over anti-diagonals, raster
+# scans only. rows: NumPy for the rows above, Python floats along the row.
+BACKENDS = ("numba", "wavefront", "rows")
+
+class ErrorDiffuser:
+    # Diffuses an image delivered as horizontal strips. The error of the last
+    # rows is carried into the next strip, so the output is identical to
+    # diffusing the whole image at once.
+    # With a quantizer (color_dither.Quantizer) strips are (h, w, 3) RGB and
+    # every pixel takes the quantizer's nearest colour, all three channels in
+    # the same pass; the output is RGB too.
+    # Serpentine scans cannot be split into anti-diagonals: every row starts
+    # where the previous one ended, so without numba they run row by row.
+    def __init__(self, width, threshold, kernel="Floyd-Steinberg", serpentine=False, dtype=np.float64, quantizer=None,
+                 backend=None):
+        self.threshold = threshold
+        self.quantizer = quantizer
+        self.divisor, taps = KERNELS[kernel]
+        # Pull order: sources in the order a raster scan reaches them
+        self.taps = sorted(taps, key=lambda t: (-t[1], -t[0]))
+        self.serpentine = serpentine
+        self.pad_x, self.pad_y = _padding(taps)
+        self.width = width
+        self.carry = np.zeros((self.pad_y, width + 2 * self.pad_x) + ((3,) if quantizer is not None else ()), dtype)
+        self.row = 0
+        if backend is None:
+            backend = "numba" if numba is not None else "rows" if serpentine else "wavefront"
+        if backend not in BACKENDS or backend == "numba" and numba is None:
+            raise ValueError(f"Unavailable error diffusion backend: {backend}")
+        if backend == "wavefront" and serpentine:
+            raise ValueError("The wavefront backend only scans in raster order")
+        self.backend = backend
+
+    def process(self, strip):
+        strip = np.asarray(strip)
+        if strip.shape[0] == 0 or self.width == 0:
+            return np.zeros(strip.shape, np.uint8)
+        if self.backend == "numba":
+            backend = _diffuse_numba if self.quantizer is None else _diffuse_color_numba
+        elif self.backend == "rows":
+            backend = _diffuse_rows if self.quantizer is None else _diffuse_color_rows
+        else:
+            backend = _diffuse_wavefront
+        out, self.carry = backend(self, strip)
+        self.row += strip.shape[0]
+        return out
+
+    def _errors(self, h):
+        # Error buffer for a strip: carried rows on top, zero padding either side
+        errs = np.zeros((self.pad_y + h,) + self.carry.shape[1:], self.carry.dtype)
+        errs[:self.pad_y] = self.carry
+        return errs
+
+    def _sign(self, y):
+        return -1 if self.serpentine and (self.row + y) % 2 else 1
+
+def diffuse(arr, threshold, kernel="Floyd-Steinberg", serpentine=False, dtype=np.float64):
+    # Returns a 0/255 uint8 array. With the default float64 buffer and raster
+    # scanning the result is bit-identical to the classic per-pixel loop.
+    arr = np.asarray(arr)
+    return ErrorDiffuser(arr.shape[1], threshold, kernel, serpentine, dtype).process(arr)
+
+def _padding(taps):
+    return max(abs(dx) for dx, _, _ in taps), max(dy for _, dy, _ in taps)
+
+def _diffuse_wavefront(state, arr):
+    # Pixel (x, y) only depends on pixels with a smaller x + slope*y, so every
+    # anti-diagonal of that form can be processed as one vector. Error is
+    # pulled from the sources in the order the serial loop would push it.
+    # RGB diagonals are (n, 3) vectors quantized to colours in one call.
+    h, w = arr.shape[:2]
+    pad_x, pad_y, divisor, threshold = state.pad_x, state.pad_y, state.divisor, state.threshold
+    quantizer = state.quantizer
+    slope = max([1] + [-dx // dy + 1 for dx, dy, _ in state.taps if dy > 0])
+    buf = state._errors(h)
+    stride = buf.shape[1]
+    channels = buf.shape[2:]
+    buf[pad_y:, pad_x:pad_x + w] = arr
+    out = np.zeros(buf.shape, np.uint8)
+    flat, flat_out = buf.reshape((-1,) + channels), out.reshape((-1,) + channels)
+    pull = [(dy * stride + dx, weight) for dx, dy, weight in state.taps]
+    step = stride - slope
+    base = pad_y * stride + pad_x
+    v = np.empty((h,) + channels, buf.dtype)
+    tmp = np.empty((h,) + channels, buf.dtype)
+    mask = np.empty(h, bool)
+    for t in range(w + slope * (h - 1)):
+        y_lo = max(0, -(-(t - w + 1) // slope))
+        y_hi = min(h - 1, t // slope)
+        n = y_hi - y_lo + 1
+        start = base + t + y_lo * step
+        stop = start + (n - 1) * step + 1
+        vn, tn, mn = v[:n], tmp[:n], mask[:n]
+        vn[...] = flat[start:stop:step]
+        for offset, weight in pull:
+            np.multiply(flat[start - offset:stop - offset:step], weight, out=tn)
+            np.divide(tn, divisor, out=tn)
+            np.add(vn, tn, out=vn)
+        if quantizer is not None:
+            q = quantizer.quantize(vn)
+            flat_out[start:stop:step] = q
+            np.subtract(vn, q, out=flat[start:stop:step])
+            continue
+        np.greater(vn, threshold, out=mn)
+        flat_out[start:stop:step] = mn
+        np.multiply(mn, 255, out=tn)
+        np.subtract(vn, tn, out=flat[start:stop:step])
+    out = out[pad_y:, pad_x:pad_x + w]
+    return out if quantizer is not None else out * np.uint8(255), buf[buf.shape[0] - pad_y:].copy()
+
+def _diffuse_rows(state, arr):
+    # Row-at-a-time: error from the rows above is pulled with one vector op per
+    # kernel tap, the in-row recurrence runs on Python floats. Only the error
+    # pushes along the row are serial; the output and the error a pixel leaves
+    # follow from its final value, so they are taken for the whole row at once.
+    h, w = arr.shape
+    pad_x, pad_y, divisor, threshold = state.pad_x, state.pad_y, state.divisor, state.threshold
+    errs = state._errors(h)
+    out = np.empty((h, w), np.uint8)
+    pad = [0.0] * pad_x
+    for y in range(h):
+        row = pad + _pull_above(state, errs, arr[y], y).tolist() + pad
+        _threshold_pass(row, *_scan(state, y), divisor, threshold)
+        final = np.array(row[pad_x:pad_x + w])
+        mask = final > threshold
+        out[y] = mask
+        errs[pad_y + y, pad_x:pad_x + w] = final - mask * 255.0
+    return out * np.uint8(255), errs[errs.shape[0] - pad_y:].copy()
+
+def _diffuse_color_rows(state, arr):
+    # _diffuse_rows on RGB. Per-channel quantizers leave the channels
+    # independent, so each runs its own recurrence; a palette couples them
+    # through the lookup table key and runs all three in one loop.
+    h, w = arr.shape[:2]
+    pad_x, pad_y, divisor = state.pad_x, state.pad_y, state.divisor
+    q = state.quantizer
+    errs = state._errors(h)
+    out = np.empty((h, w, 3), np.uint8)
+    pad = [0.0] * pad_x
+    values = q.values.astype(np.float64).tolist()
+    if q.levels == 0:
+        lut, colors = q.lut.tolist(), q.colors.astype(np.float64).tolist()
+    for y in range(h):
+        v = _pull_above(state, errs, arr[y], y)
+        rows = [pad + v[:, c].tolist() + pad for c in range(3)]
+        xs, pushes = _scan(state, y)
+        if q.levels == 0:
+            _palette_pass(rows, xs, pushes, divisor, lut, colors, q.bits)
+        for row in rows if q.levels else ():
+            if q.levels == 2:
+                _threshold_pass(row, xs, pushes, divisor, q.threshold)
+            else:
+                _levels_pass(row, xs, pushes, divisor, values)
+        final = np.array(rows)[:, pad_x:pad_x + w].T
+        new = q.quantize(final)
+        out[y] = new
+        errs[pad_y + y, pad_x:pad_x + w] = final - new
+    return out, errs[errs.shape[0] - pad_y:].copy()
+
+def _pull_above(state, errs, values, y):
+    # Row y plus the error pulled from the rows above it, one op per tap
+    w = values.shape[0]
+    pad_x, pad_y, divisor = state.pad_x, state.pad_y, state.divisor
+    v = values.astype(errs.dtype)
+    for dx, dy, weight in state.taps:
+        if dy > 0:
+            shift = state._sign(y - dy) * dx
+            v += errs[pad_y + y - dy, pad_x - shift:pad_x - shift + w] * weight / divisor
+    return v
+
+def _scan(state, y):
+    # Padded x positions of row y in scan order, and its in-row pushes
+    sign = state._sign(y)
+    pad_x, w = state.pad_x, state.width
+    xs = range(pad_x + w - 1, pad_x - 1, -1) if sign < 0 else range(pad_x, pad_x + w)
+    return xs, [(sign * dx, weight) for dx, dy, weight in state.taps if dy == 0]
+
+def _threshold_pass(row, xs, pushes, divisor, threshold):
+    # The serial part of a row of 0/255 output, unrolled for the common
+    # one and two tap kernels
+    if len(pushes) == 1:
+        (o1, w1), = pushes
+        for x in xs:
+            e = row[x]
+            if e > threshold:
+                e -= 255
+            row[x + o1] += e * w1 / divisor
+    elif len(pushes) == 2:
+        (o1, w1), (o2, w2) = pushes
+        for x in xs:
+            e = row[x]
+            if e > threshold:
+                e -= 255
+            row[x + o1] += e * w1 / divisor
+            row[x + o2] += e * w2 / divisor
+    else:
+        for x in xs:
+            e = row[x]
+            if e > threshold:
+                e -= 255
+            for o, weight in pushes:
+                row[x + o] += e * weight / divisor
+
+def _levels_pass(row, xs, pushes, divisor, values):
+    # One channel snapping to evenly spaced values, the per-channel rule
+    # of Quantizer.quantize. Clamps are conditional expressions, well over
+    # twice as fast as min()/max() calls here.
+    steps = len(values) - 1
+    for x in xs:
+        e = row[x]
+        e -= values[int((e if e < 255.0 else 255.0) * steps / 255 + 0.5) if e > 0.0 else 0]
+        for o, weight in pushes:
+            row[x + o] += e * weight / divisor
+
+def _palette_pass(rows, xs, pushes, divisor, lut, colors, bits):
+    # All three channels at once, the nearest colour read from the palette LUT
+    r, g, b = rows
+    shift = 8 - bits
+    for x in xs:
+        er, eg, eb = r[x], g[x], b[x]
+        cr, cg, cb = colors[lut[(int(er if er < 255.0 else 255.0) if er > 0.0 else 0) >> shift << 2 * bits
+                                | (int(eg if eg < 255.0 else 255.0) if eg > 0.0 else 0) >> shift << bits
+                                | (int(eb if eb < 255.0 else 255.0) if eb > 0.0 else 0) >> shift]]
+        er -= cr
+        eg -= cg
+        eb -= cb
+        for o, weight in pushes:
+            r[x + o] += er * weight / divisor
+            g[x + o] += eg * weight / divisor
+            b[x + o] += eb * weight / divisor
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _diffuse_kernel(arr, errs, out, threshold, dxs, dys, weights, divisor, pad_x, pad_y, serpentine, row0):
+        h, w = arr.shape
+        for y in range(h):
+            sign = -1 if serpentine and (row0 + y) % 2 else 1
+            for i in range(w):
+                x = w - 1 - i if sign < 0 else i
+                v = arr[y, x]
+                for k in range(dxs.shape[0]):
+                    src_sign = -1 if serpentine and (row0 + y - dys[k]) % 2 else 1
+                    v += errs[pad_y + y - dys[k], pad_x + x - src_sign * dxs[k]] * weights[k] / divisor
+                new = 255 if v > threshold else 0
+                out[y, x] = new
+                errs[pad_y + y, pad_x + x] = v - new
+
+def _diffuse_numba(state, arr):
+    h, w = arr.shape
+    errs = state._errors(h)
+    out = np.empty((h, w), np.uint8)
+    dxs = np.array([t[0] for t in state.taps], np.int64)
+    dys = np.array([t[1] for t in state.taps], np.int64)
+    weights = np.array([t[2] for t in state.taps], np.int64)
+    _diffuse_kernel(arr.astype(errs.dtype), errs, out, float(state.threshold), dxs, dys, weights, state.divisor,
+                    state.pad_x, state.pad_y, state.serpentine, state.row)
+    return out, errs[errs.shape[0] - state.pad_y:].copy()
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _diffuse_color_kernel(arr, errs, out, threshold, levels, values, colors, lut, bits, dxs, dys, weights, divisor,
+                              pad_x, pad_y, serpentine, row0):
+        # _diffuse_kernel on RGB, with color_dither.Quantizer's rules inlined
+        h, w = arr.shape[:2]
+        shift = 8 - bits
+        v = np.empty(3)
+        for y in range(h):
+            sign = -1 if serpentine and (row0 + y) % 2 else 1
+            for i in range(w):
+                x = w - 1 - i if sign < 0 else i
+                for c in range(3):
+                    v[c] = arr[y, x, c]
+                for k in range(dxs.shape[0]):
+                    src_sign = -1 if serpentine and (row0 + y - dys[k]) % 2 else 1
+                    for c in range(3):
+                        v[c] += errs[pad_y + y - dys[k], pad_x + x - src_sign * dxs[k], c] * weights[k] / divisor
+                j = 0
+                if levels == 0:
+                    key = 0
+                    for c in range(3):
+                        key = key << bits | int(min(max(v[c], 0.0), 255.0)) >> shift
+                    j = lut[key]
+                for c in range(3):
+                    if levels == 0:
+                        new = colors[j, c]
+                    elif levels == 2:
+                        new = 255.0 if v[c] > threshold else 0.0
+                    else:
+                        new = values[int(min(max(v[c], 0.0), 255.0) * (levels - 1) / 255 + 0.5)]
+                    out[y, x, c] = new
+                    errs[pad_y + y, pad_x + x, c] = v[c] - new
+
+def _diffuse_color_numba(state, arr):
+    h, w = arr.shape[:2]
+    errs = state._errors(h)
+    out = np.empty((h, w, 3), np.uint8)
+    q = state.quantizer
+    dxs = np.array([t[0] for t in state.taps], np.int64)
+    dys = np.array([t[1] for t in state.taps], np.int64)
+    weights = np.array([t[2] for t in state.taps], np.int64)
+    _diffuse_color_kernel(arr.astype(errs.dtype), errs, out, float(q.threshold), q.levels, q.values.astype(np.float64),
+                          q.colors.astype(np.float64), q.lut, q.bits, dxs, dys, weights, state.divisor,
+                          state.pad_x, state.pad_y, state.serpentine, state.row)
+    return out, errs[errs.shape[0] - state.pad_y:].copy()
@@ -1,7 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image
-import os
+import threading
+import queue
+import gif_writer
 
 class FolderToGifApp:
     def __init__(self, root):
@@ -11,6 +12,9 @@ class FolderToGifApp:
         self.input_folder = None
         self.output_file = None
         self.duration = tk.IntVar(value=100)
+        self.drop_duplicates = tk.BooleanVar(value=False)
+        self.events = queue.Queue()
+        self.worker = None
         self.setup_ui()
 
     def setup_ui(self):
@@ -25,13 +29,17 @@ class FolderToGifApp:
         duration_entry = ttk.Entry(frame, textvariable=self.duration, width=10)
         duration_entry.pack(fill=tk.X, expand=True, pady=(0, 12))
 
+        ttk.Checkbutton(frame, text="Drop duplicate frames", variable=self.drop_duplicates).pack(anchor=tk.W, pady=(0, 4))
         ttk.Label(frame, text="(GIF will loop infinitely)", foreground="gray").pack(anchor=tk.W, pady=(0, 12))
 
         ttk.Button(frame, text="Select Output GIF", command=self.select_output).pack(fill=tk.X, expand=True, pady=(0, 8))
         self.output_label = ttk.Label(frame, text="No output file selected", foreground="gray", anchor="w")
         self.output_label.pack(fill=tk.X, expand=True, pady=(0, 12))
 
-        ttk.Button(frame, text="Create GIF", command=self.create_gif).pack(fill=tk.X, expand=True, pady=(10, 0))
+        self.create_button = ttk.Button(frame, text="Create GIF", command=self.create_gif)
+        self.create_button.pack(fill=tk.X, expand=True, pady=(10, 0))
+        self.progress_label = ttk.Label(frame, text="", foreground="gray", anchor="w")
+        self.progress_label.pack(fill=tk.X, expand=True, pady=(4, 0))
 
     def select_folder(self):
         folder = filedialog.askdirectory(title="Select Folder of Images")
@@ -49,26 +57,45 @@ class FolderToGifApp:
         if not self.input_folder or not self.output_file:
             messagebox.showwarning("Missing Info", "Please select both an input folder and output file.")
             return
-        image_exts = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff'}
-        files = [f for f in os.listdir(self.input_folder) if os.path.splitext(f)[1].lower() in image_exts]
-        if not files:
+        paths = gif_writer.frame_paths(self.input_folder)
+        if not paths:
             messagebox.showwarning("No Images", "No image files found in the selected folder.")
             return
-        files.sort()  # Sort by filename
-        images = []
-        for fname in files:
-            path = os.path.join(self.input_folder, fname)
-            img = Image.open(path).convert("RGBA")
-            images.append(img)
-        # Resize all to the first image's size
-        base_size = images[0].size
-        images = [img.resize(base_size, Image.LANCZOS) for img in images]
-        duration = self.duration.get()
+        # Frames are decoded, mapped to one shared palette and written one at
+        # a time on a background thread
+        self.create_button.config(state=tk.DISABLED)
+        args = (paths, self.output_file, self.duration.get(), 0, self.drop_duplicates.get())
+        self.worker = threading.Thread(target=self._encode, args=args, daemon=True)
+        self.worker.start()
+        self.root.after(50, self.poll_progress)
+
+    def _encode(self, paths, output_file, duration, loop, drop_duplicates):
         try:
-            images[0].save(self.output_file, save_all=True, append_images=images[1:], duration=duration, loop=0, disposal=2, optimize=False)
-            messagebox.showinfo("Success", f"GIF saved to {self.output_file}\n(It will loop infinitely)")
+            progress = lambda done, total: self.events.put(("progress", done, total))
+            written, dropped = gif_writer.write_gif(paths, output_file, duration, loop, drop_duplicates, progress=progress)
+            self.events.put(("done", written, dropped))
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to create GIF: {e}")
+            self.events.put(("error", e, None))
+
+    def poll_progress(self):
+        try:
+            while True:
+                kind, a, b = self.events.get_nowait()
+                if kind == "progress":
+                    self.progress_label.config(text=f"Frame {a}/{b}")
+                    continue
+                self.create_button.config(state=tk.NORMAL)
+                if kind == "done":
+                    dropped = f", {b} duplicates dropped" if b else ""
+                    self.progress_label.config(text=f"{a} frames written{dropped}")
+                    messagebox.showinfo("Success", f"GIF saved to {self.output_file}\n(It will loop infinitely)")
+                else:
+                    self.progress_label.config(text="")
+                    messagebox.showerror("Error", f"Failed to create GIF: {a}")
+                return
+        except queue.Empty:
+            pass
+        self.root.after(50, self.poll_progress)
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,159 @@
+import os
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+import palette
+import pipeline
+
+PALETTE_SAMPLES = 16
+SAMPLE_SIDE = 128
+
+def frame_paths(folder):
+    files = sorted(f for f in os.listdir(folder) if os.path.splitext(f)[1].lower() in pipeline.IMAGE_EXTS)
+    return [os.path.join(folder, f) for f in files]
+
+def load_frame(path, size):
+    img = Image.open(path).convert("RGBA")
+    if img.size != size:
+        img = img.resize(size, Image.LANCZOS)
+    return np.asarray(img)
+
+def build_palette(frames, colors=255):
+    # One palette for the whole animation from the opaque pixels of a few
+    # frames. Returns (n, 3) uint8; index n is left free for transparency.
+    # Frames are subsampled rather than resized so no blended colours appear.
+    pixels = []
+    for rgba in frames:
+        step = -(-max(rgba.shape[:2]) // SAMPLE_SIDE)
+        arr = rgba[::step, ::step].reshape(-1, 4)
+        pixels.append(arr[arr[:, 3] >= 128, :3])
+    pixels = np.concatenate(pixels) if pixels else np.zeros((0, 3), np.uint8)
+    if not len(pixels):
+        return np.zeros((1, 3), np.uint8)
+    keys = np.unique(pixels[:, 0].astype(np.int32) << 16 | pixels[:, 1].astype(np.int32) << 8 | pixels[:, 2])
+    if len(keys) <= colors:
+        return np.stack([keys >> 16, keys >> 8 & 255, keys & 255], 1).astype(np.uint8)
+    quant = Image.fromarray(pixels[None]).quantize(colors, Image.Quantize.MEDIANCUT)
+    table = np.array(quant.getpalette(), np.uint8).reshape(-1, 3)
+    return table[np.unique(np.asarray(quant))]
+
+def to_indices(rgba, lut, transparent):
+    shift = 8 - palette.LUT_BITS
+    rgb = rgba[..., :3] >> shift
+    keys = rgb[..., 0].astype(np.int32) << 2 * palette.LUT_BITS
+    keys |= rgb[..., 1].astype(np.int32) << palette.LUT_BITS
+    keys |= rgb[..., 2]
+    out = lut[keys]
+    out[rgba[..., 3] < 128] = transparent
+    return out
+
+class GifWriter:
+    # Writes an animated GIF one frame at a time with a fixed global palette.
+    # Each frame is stored as the bounding box of the pixels that changed,
+    # with unchanged pixels inside it transparent. One frame is held back so
+    # that duplicates can extend its delay and so its disposal can be chosen
+    # once the next frame is known.
+    def __init__(self, path, size, palette, loop=0, drop_duplicates=False):
+        self.size = size
+        self.drop_duplicates = drop_duplicates
+        self.transparent = len(palette)
+        self.canvas = np.full((size[1], size[0]), self.transparent, np.uint8)
+        self.pending = None
+        self.frames = self.dropped = 0
+        bits = max(1, int(np.ceil(np.log2(len(palette) + 1))))
+        table = np.zeros((1 << bits, 3), np.uint8)
+        table[:len(palette)] = palette
+        self.fp = open(path, "wb")
+        self.fp.write(b"GIF89a" + struct.pack("<HHBBB", size[0], size[1], 0xF0 | bits - 1, self.transparent, 0))
+        self.fp.write(table.tobytes())
+        if loop is not None:
+            self.fp.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", loop) + b"\x00")
+
+    def write(self, indices, duration):
+        t = self.transparent
+        if self.pending is not None and self.drop_duplicates and np.array_equal(indices, self.canvas):
+            self.pending["duration"] += duration
+            self.dropped += 1
+            return
+        if self.pending is not None and np.any((indices == t) & (self.canvas != t)):
+            # Pixels turn transparent, which no delta over the canvas can show:
+            # re-emit the held frame whole and dispose it to the background
+            self.pending.update(box=(0, 0), data=self.canvas.copy(), disposal=2)
+            self.canvas[:] = t
+        self._flush()
+        changed = indices != self.canvas
+        rows, cols = np.flatnonzero(changed.any(1)), np.flatnonzero(changed.any(0))
+        if len(rows):
+            y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+            data = np.where(changed[y0:y1, x0:x1], indices[y0:y1, x0:x1], t).astype(np.uint8)
+            self.canvas[y0:y1, x0:x1] = indices[y0:y1, x0:x1]
+        else:
+            y0 = x0 = 0
+            data = np.full((1, 1), t, np.uint8)
+        self.pending = dict(box=(int(x0), int(y0)), data=data, duration=duration, disposal=1)
+
+    def _flush(self):
+        if self.pending is None:
+            return
+        frame = self.pending
+        self.pending = None
+        h, w = frame["data"].shape
+        delay = int(round(frame["duration"] / 10))
+        self.fp.write(b"\x21\xf9\x04" + struct.pack("<BHBB", frame["disposal"] << 2 | 1, delay, self.transparent, 0))
+        self.fp.write(b"\x2c" + struct.pack("<HHHHB", *frame["box"], w, h, 0) + b"\x08")
+        self.fp.write(Image.fromarray(frame["data"], "L").tobytes("gif", "L"))
+        self.fp.write(b"\x00")
+        self.frames += 1
+
+    def close(self):
+        if self.fp.closed:
+            return
+        try:
+            self._flush()
+            self.fp.write(b"\x3b")
+        finally:
+            self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_frames(paths, size, workers=None, convert=None):
+    # Decodes (and converts) frames on a thread pool, yielding them in order
+    # with only a few frames per worker in memory
+    workers = max(1, workers or os.cpu_count() or 1)
+
+    def task(path):
+        rgba = load_frame(path, size)
+        return convert(rgba) if convert else rgba
+    with ThreadPoolExecutor(workers) as pool:
+        in_flight = deque()
+        for path in paths:
+            in_flight.append(pool.submit(task, path))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+def sample_paths(paths, count=PALETTE_SAMPLES):
+    step = max(1, len(paths) / count)
+    return [paths[int(i * step)] for i in range(min(count, len(paths)))]
+
+def write_gif(paths, out_path, duration=100, loop=0, drop_duplicates=False, workers=None, progress=None, cancel=None):
+    # Frames are resized to the first frame's size. Returns (written, dropped).
+    size = Image.open(paths[0]).size
+    colors = build_palette(iter_frames(sample_paths(paths), size, workers))
+    lut = palette.palette_lut(colors)
+    with GifWriter(out_path, size, colors, loop, drop_duplicates) as writer:
+        frames = iter_frames(paths, size, workers, lambda rgba: to_indices(rgba, lut, len(colors)))
+        for i, indices in enumerate(frames):
+            if cancel is not None and cancel.is_set():
+                break
+            writer.write(indices, duration)
+            if progress:
+                progress(i + 1, len(paths))
+    return writer.frames, writer.dropped
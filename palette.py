@@ -0,0 +1,66 @@
+import colorsys
+import numpy as np
+from PIL import Image
+
+# Named palettes, listed dark to light. "gradient" palettes blend between the
+# colors, "nearest" palettes snap each gray level to the closest entry.
+PALETTES = {
+    "Duotone (Navy/Cream)": ("gradient", [(20, 24, 82), (250, 240, 210)]),
+    "Sepia": ("gradient", [(30, 18, 8), (112, 66, 20), (242, 226, 196)]),
+    "Thermal": ("gradient", [(0, 0, 0), (80, 0, 160), (230, 40, 40), (255, 200, 0), (255, 255, 255)]),
+    "Game Boy": ("nearest", [(15, 56, 15), (48, 98, 48), (139, 172, 15), (155, 188, 15)]),
+    "CGA": ("nearest", [(0, 0, 0), (255, 85, 255), (85, 255, 255), (255, 255, 255)]),
+}
+PALETTE_OPTIONS = ["Mono Hue"] + list(PALETTES)
+LUT_BITS = 6  # nearest-colour tables are indexed by the top bits of each channel
+
+def mono_hue_lut(hue):
+    lut = np.empty((256, 3), np.uint8)
+    for i in range(256):
+        r, g, b = colorsys.hsv_to_rgb(hue, 1, i / 255.0)
+        lut[i] = (int(r*255), int(g*255), int(b*255))
+    return lut
+
+def gradient_lut(colors):
+    colors = np.asarray(colors, float)
+    if len(colors) == 1:
+        return np.repeat(colors.astype(np.uint8), 256, axis=0)
+    stops = np.linspace(0, 255, len(colors))
+    levels = np.arange(256)
+    return np.stack([np.interp(levels, stops, colors[:, c]) for c in range(3)], axis=1).round().astype(np.uint8)
+
+def nearest_lut(colors):
+    # Map each gray level to the palette entry with the closest luminance
+    colors = np.asarray(colors, np.uint8)
+    luma = colors @ np.array([0.299, 0.587, 0.114])
+    idx = np.abs(np.arange(256)[:, None] - luma[None, :]).argmin(axis=1)
+    return colors[idx]
+
+def build_lut(name, hue=0.0):
+    if name not in PALETTES:
+        return mono_hue_lut(hue)
+    kind, colors = PALETTES[name]
+    return nearest_lut(colors) if kind == "nearest" else gradient_lut(colors)
+
+def colorize(img, lut):
+    # Recolor a grayscale image in one pass by attaching the LUT as a palette
+    if isinstance(img, np.ndarray):
+        return Image.fromarray(np.asarray(lut, np.uint8)[img])
+    p_img = img.convert("L")
+    p_img.putpalette(np.asarray(lut, np.uint8).tobytes())
+    return p_img.convert("RGB")
+
+def palette_lut(colors):
+    # Nearest palette index for every colour on a 2**LUT_BITS per channel grid
+    step = 1 << (8 - LUT_BITS)
+    centers = np.arange(0, 256, step) + step // 2
+    grid = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), -1).reshape(-1, 3).astype(np.float32)
+    pal = np.asarray(colors).astype(np.int32)
+    # |g - p|^2 without the |g|^2 term, which is the same for every p; exact
+    # in float32 at these magnitudes
+    lut = (grid @ (-2 * pal.T.astype(np.float32)) + (pal ** 2).sum(1)).argmin(1).astype(np.uint8)
+    # Exact palette colours always map to themselves
+    shift = 8 - LUT_BITS
+    keys = (pal[:, 0] >> shift) << 2 * LUT_BITS | (pal[:, 1] >> shift) << LUT_BITS | pal[:, 2] >> shift
+    lut[keys[::-1]] = np.arange(len(pal))[::-1]
+    return lut
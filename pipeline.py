@@ -0,0 +1,100 @@
+from dataclasses import dataclass
+from PIL import Image
+import numpy as np
+import color_dither
+import error_diffusion
+import palette
+import shapes
+import threshold_maps
+import tone
+
+ALGORITHMS = ["Floyd-Steinberg", "Ordered"] + [k for k in error_diffusion.KERNELS if k != "Floyd-Steinberg"]
+SHAPES = ["Circles", "Squares (aligned)", "Triangles (aligned)", "Squares (random)", "Triangles (random)"]
+IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff'}
+
+@dataclass(frozen=True)
+class DitherParams:
+    brightness: float = 1.0
+    contrast: float = 1.0
+    black_clip: int = 0
+    gamma: float = 1.0
+    levels_low: int = 0
+    levels_high: int = 255
+    curve: tuple = ()
+    algorithm: str = ALGORITHMS[0]
+    threshold: int = 128
+    serpentine: bool = False
+    threshold_map: str = "Bayer 8x8"
+    dot_size: int = 4
+    detail: int = 8
+    shape: str = SHAPES[0]
+    zoom: float = 1.0
+    color_mode: str = "grayscale"
+    hue: float = 0.0
+    palette: str = palette.PALETTE_OPTIONS[0]
+    full_palette: str = color_dither.PALETTE_OPTIONS[0]
+
+def resize(img, zoom):
+    img_w, img_h = img.size
+    return img.resize((int(img_w * zoom), int(img_h * zoom)), Image.LANCZOS)
+
+def gray_image(img, zoom):
+    # Grayscale first so the resize touches one channel instead of three.
+    # Tone then acts on luminance, so unlike per-channel ImageEnhance, bright
+    # saturated colours are not clipped channel by channel (see README).
+    return np.array(resize(img.convert("L"), zoom))
+
+def colorize(img, params):
+    if params.color_mode == "color":
+        return palette.colorize(img, palette.build_lut(params.palette, params.hue))
+    return img
+
+def dither_gray(arr, params):
+    if params.algorithm == "Ordered":
+        return threshold_maps.ordered_dither(arr, params.threshold_map)
+    return error_diffusion.diffuse(arr, params.threshold, params.algorithm, serpentine=params.serpentine)
+
+def render_shapes(img, params, cache=None, source_key=None):
+    # Preview and batch path: grayscale and zoom, tone, shape dither and
+    # colorize. With a StageCache each stage is memoized on its inputs, so a
+    # change only recomputes the stages after it.
+    stage = cache.stage if cache is not None else _run_stage
+    key = ("gray", source_key, params.zoom)
+    gray = stage(key, lambda: gray_image(img, params.zoom))
+    key = ("tone", key) + tone.tone_key(params)
+    toned = stage(key, lambda: tone.apply(gray, params))
+    key = ("shape", key, params.shape, params.dot_size, params.detail, params.threshold)
+    mask = stage(key, lambda: shapes.render(toned, params.shape, params.dot_size, params.detail, params.threshold))
+    key = ("color", key) + color_key(params)
+    return stage(key, lambda: colorize(Image.fromarray(mask).convert("RGB"), params))
+
+def _run_stage(key, compute):
+    return compute()
+
+def color_key(params):
+    if params.color_mode != "color":
+        return (params.color_mode,)
+    if params.palette in palette.PALETTES:
+        return (params.color_mode, params.palette)
+    return (params.color_mode, params.palette, params.hue)
+
+def render_dither(img, params, cache=None, source_key=None):
+    # Full-resolution save path: the same gray and tone stages as
+    # render_shapes, then algorithm dither and colorize. Full colour mode
+    # tones and dithers RGB instead and needs no colorize.
+    stage = cache.stage if cache is not None else _run_stage
+    if params.color_mode == "full":
+        key = ("rgb", source_key, params.zoom)
+        rgb = stage(key, lambda: np.array(resize(img.convert("RGB"), params.zoom)))
+        key = ("tone", key) + tone.tone_key(params)
+        toned = stage(key, lambda: color_dither.tone_rgb(rgb, params))
+        key = ("dither", key, params.algorithm, params.threshold, params.serpentine, params.threshold_map, params.full_palette)
+        return stage(key, lambda: Image.fromarray(color_dither.dither(toned, params, color_dither.quantizer(params, img))))
+    key = ("gray", source_key, params.zoom)
+    gray = stage(key, lambda: gray_image(img, params.zoom))
+    key = ("tone", key) + tone.tone_key(params)
+    toned = stage(key, lambda: tone.apply(gray, params))
+    key = ("dither", key, params.algorithm, params.threshold, params.serpentine, params.threshold_map)
+    arr = stage(key, lambda: dither_gray(toned, params))
+    key = ("color", key) + color_key(params)
+    return stage(key, lambda: colorize(Image.fromarray(arr).convert("L"), params))
@@ -0,0 +1,71 @@
+import os
+import struct
+import zlib
+import numpy as np
+
+COLOR_TYPES = {"L": (0, 1), "RGB": (2, 3)}
+
+class PngStripWriter:
+    # Writes a PNG one band of rows at a time, so the full image never has to
+    # exist in memory. Rows must arrive top to bottom and add up to `height`.
+    # Bands go to a temporary file beside `path`, which replaces it only once
+    # the PNG is complete, so a failed save never leaves a truncated image.
+    def __init__(self, path, width, height, mode="L", level=6):
+        self.color_type, self.channels = COLOR_TYPES[mode]
+        self.width, self.height = width, height
+        self.rows = 0
+        self.path = path
+        folder, name = os.path.split(os.path.abspath(path))
+        self.tmp = os.path.join(folder, f".{name}.{os.getpid()}.part")
+        self.file = open(self.tmp, "wb")
+        self.compressor = zlib.compressobj(level)
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, self.color_type, 0, 0, 0))
+
+    def write(self, rows):
+        rows = np.asarray(rows, np.uint8).reshape(-1, self.width * self.channels)
+        if self.rows + len(rows) > self.height:
+            raise ValueError("more rows written than the image height")
+        # Filter type 0 (None) byte in front of every scanline
+        data = np.zeros((len(rows), rows.shape[1] + 1), np.uint8)
+        data[:, 1:] = rows
+        self.rows += len(rows)
+        compressed = self.compressor.compress(data.tobytes())
+        if compressed:
+            self._chunk(b"IDAT", compressed)
+
+    def close(self):
+        if self.file is None:
+            return
+        try:
+            if self.rows != self.height:
+                raise ValueError(f"expected {self.height} rows, got {self.rows}")
+            self._chunk(b"IDAT", self.compressor.flush())
+            self._chunk(b"IEND", b"")
+            self.file.close()
+            self.file = None
+            os.replace(self.tmp, self.path)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        # Drop the partial file; the destination is left as it was
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+    def _chunk(self, kind, payload):
+        self.file.write(struct.pack(">I", len(payload)) + kind + payload)
+        self.file.write(struct.pack(">I", zlib.crc32(kind + payload) & 0xFFFFFFFF))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
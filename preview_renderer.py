@@ -0,0 +1,78 @@
+import queue
+import threading
+import time
+import profiling
+import viewport
+
+class Cancelled(Exception):
+    pass
+
+class _CheckedStages:
+    # Stage runner that gives up as soon as a newer request has arrived
+    def __init__(self, cache, is_stale):
+        self.cache = cache
+        self.is_stale = is_stale
+
+    def stage(self, key, compute):
+        if self.is_stale():
+            raise Cancelled()
+        return self.cache.stage(key, compute)
+
+class PreviewRenderer:
+    # Renders the canvas view on a worker thread. Only the most recent request
+    # is rendered; an older one is abandoned at its next tile. When full
+    # renders are slow a quick pass from the next pyramid level is shown
+    # first. Finished frames are collected from `results` on the Tk main
+    # thread.
+    QUICK_AFTER = 0.05  # seconds a full render must take before quick passes start
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.results = queue.Queue()
+        self.generation = 0
+        self.request = None
+        self.last_full = 0.0
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, pyramid, params, view):
+        with self.cond:
+            self.generation += 1
+            self.request = (self.generation, pyramid, params, view)
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.request is None:
+                    self.cond.wait()
+                generation, pyramid, params, view = self.request
+                self.request = None
+            stages = _CheckedStages(self.cache, lambda: self.generation != generation)
+            try:
+                if self.last_full > self.QUICK_AFTER and pyramid.level_for(view.scale) < len(pyramid.levels) - 1:
+                    recorder = profiling.StageRecorder(stages)
+                    quick = viewport.render_view(pyramid, params, view, recorder, coarser=1)
+                    self.results.put((generation, quick, False, recorder))
+                recorder = profiling.StageRecorder(stages)
+                start = time.perf_counter()
+                full = viewport.render_view(pyramid, params, view, recorder)
+                self.last_full = time.perf_counter() - start
+                self.results.put((generation, full, True, recorder))
+            except Cancelled:
+                continue
+            except Exception as e:
+                self.results.put((generation, e, True, None))
+
+    def latest(self):
+        # Newest finished (image, final, recorder) for the current request, or None
+        frame = None
+        try:
+            while True:
+                generation, image, final, recorder = self.results.get_nowait()
+                if generation == self.generation:
+                    frame = (image, final, recorder)
+        except queue.Empty:
+            pass
+        return frame
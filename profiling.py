@@ -0,0 +1,90 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from stage_cache import nbytes
+
+def pixel_count(value):
+    shape = getattr(value, "shape", None)
+    if shape is not None and len(shape) >= 2:
+        return int(shape[0] * shape[1])
+    size = getattr(value, "size", None)
+    if isinstance(size, tuple):
+        return size[0] * size[1]
+    return 0
+
+class StageRecorder:
+    # Stage runner that records wall time, pixel count and output size of
+    # every stage it computes. Wraps another runner (a StageCache, say), in
+    # which case cache hits cost nothing and are not recorded.
+    def __init__(self, inner=None):
+        self.inner = inner
+        self.records = []
+
+    def stage(self, key, compute):
+        if self.inner is None:
+            return self.timed(key[0], compute)
+        return self.inner.stage(key, lambda: self.timed(key[0], compute))
+
+    def timed(self, name, fn, *args, **kwargs):
+        # While tracemalloc is tracing, also record the stage's peak allocation
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        value = fn(*args, **kwargs)
+        return self.add(name, time.perf_counter() - start, value)
+
+    def add(self, name, seconds, value=None):
+        record = dict(stage=name, seconds=seconds, pixels=pixel_count(value), bytes=nbytes(value))
+        if tracemalloc.is_tracing():
+            record["traced_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        self.records.append(record)
+        return value
+
+    @property
+    def total(self):
+        return sum(r["seconds"] for r in self.records)
+
+    def summary(self):
+        # Repeated stages (tiles, say) are summed under one entry
+        totals, counts, pixels = {}, {}, {}
+        for r in self.records:
+            name = r["stage"]
+            totals[name] = totals.get(name, 0.0) + r["seconds"]
+            counts[name] = counts.get(name, 0) + 1
+            pixels[name] = pixels.get(name, 0) + r["pixels"]
+        parts = []
+        for name, seconds in totals.items():
+            repeat = f" x{counts[name]}" if counts[name] > 1 else ""
+            parts.append(f"{name}{repeat} {seconds * 1000:.1f}ms")
+        pixels = max(pixels.values(), default=0)
+        return "  ".join(parts) + f"  | total {self.total * 1000:.1f}ms, {pixels / 1e6:.2f} MP"
+
+def capture(path, fn, *args, **kwargs):
+    # Runs fn once under cProfile and tracemalloc. Writes `path` (pstats
+    # format, for snakeviz or pstats) and `path`.txt with the top functions
+    # and allocation sites.
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        result = fn(*args, **kwargs)
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        profiler.disable()
+        if not tracing:
+            tracemalloc.stop()
+    profiler.dump_stats(path)
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(30)
+    text.write(f"\nPeak traced memory: {peak / 2**20:.1f} MB\nTop allocation sites:\n")
+    for stat in snapshot.statistics("lineno")[:25]:
+        text.write(f"{stat}\n")
+    with open(path + ".txt", "w") as f:
+        f.write(text.getvalue())
+    return result
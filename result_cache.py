@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import asdict
+import threshold_maps
+
+CACHE_VERSION = 1  # bump when rendering changes so old results are not reused
+DEFAULT_MB = 2048
+
+def default_dir():
+    return os.path.join(threshold_maps.cache_dir(), "results")
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _copy(src, dst):
+    # Readers never see a partly written file
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+class ResultCache:
+    # Rendered outputs on disk, addressed by the hash of the source file's
+    # bytes plus every setting that affects the result. Safe to share between
+    # processes. A file's mtime records its last use, and evict() removes the
+    # least recently used results once the directory is over max_mb.
+    def __init__(self, directory=None, max_mb=DEFAULT_MB):
+        self.directory = directory or default_dir()
+        self.max_bytes = int(max_mb * 2**20)
+
+    def key(self, src, params, mode, ext):
+        settings = json.dumps(dict(version=CACHE_VERSION, mode=mode, ext=ext.lower(), params=asdict(params)), sort_keys=True)
+        return hashlib.sha256(f"{file_digest(src)}:{settings}".encode()).hexdigest()
+
+    def path(self, key, ext):
+        return os.path.join(self.directory, key[:2], key + ext.lower())
+
+    def fetch(self, key, ext, dst):
+        # Copies a cached result to dst; False on a miss
+        path = self.path(key, ext)
+        try:
+            os.utime(path)
+            _copy(path, dst)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(self, key, ext, result_path):
+        path = self.path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _copy(result_path, path)
+
+    def entries(self):
+        # (last use, size, path) of every cached result
+        found = []
+        if not os.path.isdir(self.directory):
+            return found
+        for bucket in os.scandir(self.directory):
+            if bucket.is_dir():
+                for entry in os.scandir(bucket.path):
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        st = entry.stat()
+                        found.append((st.st_mtime, st.st_size, entry.path))
+        return found
+
+    def evict(self):
+        # Returns the number of results removed
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        return removed
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
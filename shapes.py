@@ -0,0 +1,99 @@
+import math
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw
+
+ANGLE_STEPS = 64  # random orientations are quantized so stamps can be reused
+SEED = 42
+
+def shape_kind(shape):
+    if shape.startswith("Circle"):
+        return "circle"
+    if shape.startswith("Square"):
+        return "square"
+    return "triangle"
+
+def block_means(arr, detail):
+    # Mean of every detail x detail block in one reduce; edge blocks are partial
+    h, w = arr.shape
+    gh, gw = -(-h // detail), -(-w // detail)
+    padded = np.zeros((gh * detail, gw * detail), np.int64)
+    padded[:h, :w] = arr
+    sums = padded.reshape(gh, detail, gw, detail).sum(axis=(1, 3))
+    rows = np.minimum(detail, h - np.arange(gh) * detail)
+    cols = np.minimum(detail, w - np.arange(gw) * detail)
+    return sums / np.outer(rows, cols)
+
+def dot_sizes(means, threshold, dot_size):
+    # 0 marks an empty cell, otherwise size grows with brightness above threshold
+    span = max(255 - threshold, 1e-9)
+    rel = np.clip((means - threshold) / span, 0, 1)
+    sizes = (1 + rel * (dot_size - 1)).astype(np.int64)
+    sizes[means < threshold] = 0
+    return sizes
+
+def cell_angles(rows, cols, seed=SEED):
+    # Counter-based hash (splitmix64) so a cell's angle depends only on its
+    # grid position: deterministic, vectorized and stable across tiles/frames
+    x = (np.asarray(rows, np.uint64) << np.uint64(32)) ^ np.asarray(cols, np.uint64)
+    x = x + np.uint64((seed * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x % np.uint64(ANGLE_STEPS)).astype(np.int64)
+
+def stamp_radius(dot_size):
+    return dot_size // 2 + 2
+
+@lru_cache(maxsize=4096)
+def stamp(kind, size, angle_step):
+    # Rasterized shape centred in a (2r+1) square. Circles match a per-cell
+    # ImageDraw call exactly; polygon edges are rounded at stamp-local rather
+    # than image coordinates, so squares/triangles can differ by an edge pixel
+    r = stamp_radius(size)
+    img = Image.new("L", (2 * r + 1, 2 * r + 1), 0)
+    draw = ImageDraw.Draw(img)
+    if kind == "circle":
+        draw.ellipse([r - size//2, r - size//2, r + size//2, r + size//2], fill=255)
+    else:
+        corners = 4 if kind == "square" else 3
+        spread = math.pi/4 if kind == "square" else 2*math.pi/3
+        rad = math.radians(angle_step * 360 / ANGLE_STEPS)
+        half = size/2
+        draw.polygon([(r + half*math.cos(rad + spread*i), r + half*math.sin(rad + spread*i)) for i in range(corners)], fill=255)
+    out = np.asarray(img) > 0
+    out.flags.writeable = False
+    return out
+
+def render(arr, shape, dot_size, detail, threshold, seed=SEED, cell_row0=0, cell_col0=0):
+    # Returns a uint8 0/255 mask with one stamped shape per detail-sized cell.
+    # cell_row0/cell_col0 give the grid position of arr's first cell when
+    # rendering a strip or tile.
+    h, w = arr.shape
+    sizes = dot_sizes(block_means(arr, detail), threshold, dot_size)
+    gh, gw = sizes.shape
+    kind = shape_kind(shape)
+    if kind != "circle" and "random" in shape.lower():
+        angles = cell_angles(cell_row0 + np.arange(gh)[:, None], cell_col0 + np.arange(gw)[None, :], seed)
+    else:
+        angles = np.zeros_like(sizes)
+    # Index every (size, angle) stamp in use into one table of equal-sized windows
+    keys, key_idx = np.unique(sizes * ANGLE_STEPS + angles, return_inverse=True)
+    key_idx = key_idx.reshape(gh, gw)
+    r = stamp_radius(dot_size)
+    window = 2 * r + 1
+    table = np.zeros((len(keys), window, window), bool)
+    for i, key in enumerate(keys):
+        size, angle_step = divmod(int(key), ANGLE_STEPS)
+        if size == 0:
+            continue
+        s = stamp(kind, size, angle_step)
+        o = r - s.shape[0] // 2
+        table[i, o:o + s.shape[0], o:o + s.shape[1]] = s
+    # OR each stamp offset into a strided view covering all cell centres at once
+    out = np.zeros((gh * detail + window, gw * detail + window), bool)
+    c = detail // 2
+    for dy, dx in zip(*np.nonzero(table.any(axis=0))):
+        view = out[c + dy:c + dy + gh * detail:detail, c + dx:c + dx + gw * detail:detail]
+        view |= table[:, dy, dx][key_idx]
+    return out[r:r + h, r:r + w].astype(np.uint8) * np.uint8(255)
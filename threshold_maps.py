@@ -0,0 +1,129 @@
+import os
+from functools import lru_cache
+import numpy as np
+
+BLUE_NOISE_SIZE = 64
+MAP_OPTIONS = ["Bayer 2x2", "Bayer 4x4", "Bayer 8x8", "Bayer 16x16", "Blue Noise", "Clustered Dot"]
+
+def cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "dither")
+
+def bayer_ranks(n):
+    m = np.zeros((1, 1), np.int64)
+    while m.shape[0] < n:
+        m = np.block([[4*m, 4*m + 2], [4*m + 3, 4*m + 1]])
+    return m
+
+def clustered_dot_ranks(n=8):
+    # Dots grow from the centre of each cell outwards
+    u = (np.arange(n) + 0.5) / n * 2 - 1
+    spot = (np.cos(np.pi * u)[:, None] + np.cos(np.pi * u)[None, :]) / 2
+    order = np.argsort(-spot.ravel(), kind="stable")
+    ranks = np.empty(n * n, np.int64)
+    ranks[order] = np.arange(n * n)
+    return ranks.reshape(n, n)
+
+def void_and_cluster_ranks(size=BLUE_NOISE_SIZE, sigma=1.5, seed=0):
+    # Ulichney's void-and-cluster method on a torus
+    n = size * size
+    d = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(d[:, None]**2 + d[None, :]**2) / (2 * sigma**2))
+    kernel_f = np.fft.rfft2(kernel)
+
+    def energy_of(pattern):
+        return np.fft.irfft2(np.fft.rfft2(pattern.reshape(size, size)) * kernel_f, s=(size, size)).ravel()
+
+    def splat(i):
+        return np.roll(kernel, (i // size, i % size), axis=(0, 1)).ravel()
+
+    def tightest_cluster(pattern, energy):
+        return int(np.argmax(np.where(pattern, energy, -np.inf)))
+
+    def largest_void(pattern, energy):
+        return int(np.argmin(np.where(pattern, np.inf, energy)))
+
+    rng = np.random.default_rng(seed)
+    pattern = np.zeros(n, bool)
+    pattern[rng.choice(n, n // 10, replace=False)] = True
+    energy = energy_of(pattern)
+    # Move points from clusters to voids until the initial pattern is even
+    while True:
+        cluster = tightest_cluster(pattern, energy)
+        pattern[cluster] = False
+        energy -= splat(cluster)
+        void = largest_void(pattern, energy)
+        pattern[void] = True
+        energy += splat(void)
+        if void == cluster:
+            break
+    ranks = np.zeros(n, np.int64)
+    ones = int(pattern.sum())
+    p, e = pattern.copy(), energy.copy()
+    for rank in range(ones - 1, -1, -1):
+        c = tightest_cluster(p, e)
+        p[c] = False
+        e -= splat(c)
+        ranks[c] = rank
+    p, e = pattern.copy(), energy.copy()
+    for rank in range(ones, n // 2):
+        v = largest_void(p, e)
+        p[v] = True
+        e += splat(v)
+        ranks[v] = rank
+    # Past half full the zeros are the minority, so fill their tightest clusters
+    e = energy_of(~p)
+    for rank in range(n // 2, n):
+        c = tightest_cluster(~p, e)
+        p[c] = True
+        e -= splat(c)
+        ranks[c] = rank
+    return ranks.reshape(size, size)
+
+def blue_noise_ranks(size=BLUE_NOISE_SIZE):
+    # Generated once per machine and reused from the on-disk cache
+    path = os.path.join(cache_dir(), f"blue_noise_{size}.npy")
+    try:
+        ranks = np.load(path)
+        if ranks.shape == (size, size):
+            return ranks
+    except (OSError, ValueError):
+        pass
+    ranks = void_and_cluster_ranks(size)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp, ranks)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return ranks
+
+@lru_cache(maxsize=None)
+def threshold_map(name):
+    # uint8 map where a pixel is white when its value is strictly greater
+    if name.startswith("Bayer"):
+        ranks = bayer_ranks(int(name.split()[1].split("x")[0]))
+    elif name == "Blue Noise":
+        ranks = blue_noise_ranks()
+    elif name == "Clustered Dot":
+        ranks = clustered_dot_ranks()
+    else:
+        raise ValueError(f"Unknown threshold map: {name}")
+    tmap = np.floor((ranks + 0.5) * 255 / ranks.size).astype(np.uint8)
+    tmap.flags.writeable = False
+    return tmap
+
+def ordered_dither(arr, name="Bayer 8x8", row0=0, col0=0):
+    # Tiles the map over arr without building an image-sized map: one period
+    # of map rows is laid out across the width and broadcast over row blocks.
+    # row0/col0 place arr inside a larger image so strips and tiles line up.
+    tmap = threshold_map(name)
+    n = tmap.shape[0]
+    h, w = arr.shape
+    band = tmap[(row0 + np.arange(n)) % n][:, (col0 + np.arange(w)) % n]
+    mask = np.empty((h, w), bool)
+    q, r = divmod(h, n)
+    np.greater(arr[:q * n].reshape(q, n, w), band, out=mask[:q * n].reshape(q, n, w))
+    np.greater(arr[q * n:], band[:r], out=mask[q * n:])
+    return np.multiply(mask, 255, dtype=np.uint8)
@@ -0,0 +1,170 @@
+import math
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+import color_dither
+import error_diffusion
+import palette
+import shapes
+import threshold_maps
+import tone
+from png_stream import PngStripWriter
+
+# Rough working set per output pixel of a strip: resized RGB band, tone passes,
+# diffusion buffers or shape masks, and the colorized output band. Full colour
+# keeps three channels through every stage.
+BYTES_PER_PIXEL = 48
+FULL_COLOR_FACTOR = 3
+# Pillow's fixed-point resampling: 8-bit pixels times coefficients scaled by
+# 2**PRECISION_BITS, summed in 32 bits
+PRECISION_BITS = 22
+LANCZOS_SUPPORT = 3.0
+
+def output_size(img, zoom):
+    img_w, img_h = img.size
+    return int(img_w * zoom), int(img_h * zoom)
+
+def needs_tiling(img, params, memory_mb):
+    out_w, out_h = output_size(img, params.zoom)
+    factor = FULL_COLOR_FACTOR if params.color_mode == "full" else 1
+    return out_w * out_h * BYTES_PER_PIXEL * factor > memory_mb * 2**20
+
+def strip_rows(width, memory_mb, strips_in_memory=1, align=1):
+    rows = int(memory_mb * 2**20) // max(1, width * BYTES_PER_PIXEL * strips_in_memory)
+    return max(align, rows // align * align)
+
+def render_to_png(img, path, params, mode="shapes", memory_mb=512, workers=None):
+    # Streams the same result as pipeline.render_shapes/render_dither to a PNG
+    # in horizontal strips. Only the decoded source and its gray copy are held
+    # at full size.
+    # Ordered and shape strips run in parallel; error diffusion runs in order
+    # and carries its error rows from strip to strip.
+    workers = max(1, workers or os.cpu_count() or 1)
+    out_w, out_h = output_size(img, params.zoom)
+    lut = palette.build_lut(params.palette, params.hue) if params.color_mode == "color" else None
+    full = mode == "dither" and params.color_mode == "full"
+    base = img.convert("RGB") if full else img.convert("L")
+    # Full colour strips hold three channels, so fewer rows fit the budget
+    width = out_w * FULL_COLOR_FACTOR if full else out_w
+
+    def source(y0, y1):
+        return resize_rows(base, (out_w, out_h), y0, y1)
+    mean = strip_contrast_mean(source, params, out_w, out_h, workers) if tone.needs_mean(params) else 128
+    tone_lut = tone.tone_lut(params, mean)
+
+    def finish(mask):
+        return lut[mask] if lut is not None else mask
+
+    if mode == "shapes":
+        detail = params.detail
+        halo = -(-shapes.stamp_radius(params.dot_size) // detail) * detail
+
+        def task(y0, y1):
+            a, b = max(0, y0 - halo), min(out_h, y1 + halo)
+            region = tone_lut[source(a, b)]
+            mask = shapes.render(region, params.shape, params.dot_size, detail, params.threshold, cell_row0=a // detail)
+            return finish(mask[y0 - a:y1 - a])
+        rows = strip_rows(out_w, memory_mb, workers + 1, align=detail)
+        sequential = False
+    elif params.algorithm == "Ordered":
+        quant = color_dither.quantizer(params, img) if full else None
+
+        def task(y0, y1):
+            if full:
+                return color_dither.ordered_dither(tone_lut[source(y0, y1)], params.threshold_map, quant, row0=y0)
+            return finish(threshold_maps.ordered_dither(tone_lut[source(y0, y1)], params.threshold_map, row0=y0))
+        rows = strip_rows(width, memory_mb, workers + 1)
+        sequential = False
+    else:
+        quant = color_dither.quantizer(params, img) if full else None
+        diffuser = error_diffusion.ErrorDiffuser(out_w, params.threshold, params.algorithm, params.serpentine, quantizer=quant)
+
+        def task(y0, y1):
+            return finish(diffuser.process(tone_lut[source(y0, y1)]))
+        rows = strip_rows(width, memory_mb)
+        sequential = True
+
+    bands = [(y0, min(out_h, y0 + rows)) for y0 in range(0, out_h, rows)]
+    with PngStripWriter(path, out_w, out_h, "RGB" if lut is not None or full else "L") as writer:
+        if sequential or workers == 1:
+            for y0, y1 in bands:
+                writer.write(task(y0, y1))
+        else:
+            with ThreadPoolExecutor(workers) as pool:
+                in_flight = deque()
+                for y0, y1 in bands:
+                    in_flight.append(pool.submit(task, y0, y1))
+                    if len(in_flight) >= workers:
+                        writer.write(in_flight.popleft().result())
+                while in_flight:
+                    writer.write(in_flight.popleft().result())
+    return out_w, out_h
+
+def resize_rows(img, size, y0, y1):
+    # Rows y0:y1 of img.resize(size, Image.LANCZOS), bit for bit, reading
+    # only the source rows they need. Pillow resizes horizontally first, row
+    # by row, so that pass runs on the band; the vertical pass is redone here
+    # on the whole-image sampling grid, since resizing a box of the source
+    # places its samples with different rounding.
+    out_w, out_h = size
+    src_w, src_h = img.size
+    if out_h == src_h:
+        return np.array(img.crop((0, y0, src_w, y1)).resize((out_w, y1 - y0), Image.LANCZOS))
+    bounds, coeffs = _lanczos_coeffs(src_h, out_h, y0, y1)
+    a, b = bounds[:, 0].min(), (bounds[:, 0] + bounds[:, 1]).max()
+    band = np.array(img.crop((0, a, src_w, b)).resize((out_w, b - a), Image.LANCZOS))
+    acc = np.full((y1 - y0,) + band.shape[1:], 1 << PRECISION_BITS - 1, np.int32)
+    shape = (-1,) + (1,) * (band.ndim - 1)
+    for j in range(coeffs.shape[1]):
+        rows = np.minimum(bounds[:, 0] - a + j, b - a - 1)  # taps past a row's span have zero weight
+        acc += band[rows].astype(np.int32) * coeffs[:, j].reshape(shape)
+    return np.clip(acc >> PRECISION_BITS, 0, 255).astype(np.uint8)
+
+def _lanczos_coeffs(in_size, out_size, y0, y1):
+    # Pillow's precompute_coeffs and normalize_coeffs_8bpc for output rows
+    # y0:y1, with the same floating point steps so every coefficient rounds
+    # the same way. Returns (first source row, row count) per output row and
+    # the int32 coefficients.
+    scale = in_size / out_size
+    filterscale = max(scale, 1.0)
+    support = LANCZOS_SUPPORT * filterscale
+    ksize = int(math.ceil(support)) * 2 + 1
+    ss = 1.0 / filterscale
+    bounds = np.zeros((y1 - y0, 2), np.intp)
+    coeffs = np.zeros((y1 - y0, ksize), np.int32)
+    for i, yy in enumerate(range(y0, y1)):
+        center = (yy + 0.5) * scale
+        ymin = max(0, int(center - support + 0.5))
+        ymax = min(in_size, int(center + support + 0.5)) - ymin
+        k = [_lanczos((y + ymin - center + 0.5) * ss) for y in range(ymax)]
+        ww = 0.0
+        for w in k:  # plain left to right sum, as Pillow accumulates
+            ww += w
+        if ww != 0.0:
+            k = [w / ww for w in k]
+        coeffs[i, :ymax] = [int(w * (1 << PRECISION_BITS) + (-0.5 if w < 0 else 0.5)) for w in k]
+        bounds[i] = ymin, ymax
+    return bounds, coeffs
+
+def _sinc(x):
+    if x == 0.0:
+        return 1.0
+    x = x * math.pi
+    return math.sin(x) / x
+
+def _lanczos(x):
+    return _sinc(x) * _sinc(x / 3) if -3.0 <= x < 3.0 else 0.0
+
+def strip_contrast_mean(source, params, out_w, out_h, workers=1):
+    # Contrast pivots on the mean gray of the whole image, so gather its
+    # histogram strip by strip first
+    rows = strip_rows(out_w, 64)
+    with ThreadPoolExecutor(workers) as pool:
+        hist = sum(pool.map(lambda y0: tone.histogram(_luma(source(y0, min(out_h, y0 + rows)))), range(0, out_h, rows)))
+    return tone.contrast_mean(hist, params.brightness)
+
+def _luma(band):
+    # Full colour contrast pivots on the mean luminance, as color_dither.tone_rgb
+    return np.asarray(Image.fromarray(band).convert("L")) if band.ndim == 3 else band
@@ -0,0 +1,53 @@
+import numpy as np
+
+FIELDS = ("brightness", "contrast", "black_clip", "gamma", "levels_low", "levels_high", "curve")
+
+def tone_key(params):
+    return tuple(getattr(params, name) for name in FIELDS)
+
+def needs_mean(params):
+    return params.contrast != 1.0
+
+def parse_curve(text):
+    # "x,y x,y ..." control points of a piecewise-linear curve on 0..255
+    points = []
+    for pair in text.replace(";", " ").split():
+        x, y = (float(v) for v in pair.split(","))
+        if not (0 <= x <= 255 and 0 <= y <= 255):
+            raise ValueError(f"Curve point out of range: {pair}")
+        points.append((x, y))
+    return tuple(sorted(points))
+
+def histogram(gray):
+    return np.bincount(np.asarray(gray).ravel(), minlength=256)
+
+def contrast_mean(hist, brightness):
+    # Mean gray after brightness, the pivot ImageEnhance.Contrast would use
+    bright = np.clip(np.arange(256) * brightness, 0, 255)
+    return int((hist * bright).sum() / max(int(hist.sum()), 1) + 0.5)
+
+def tone_lut(params, mean=128):
+    # Brightness, contrast, levels, gamma, curve and black clip as one
+    # uint8 lookup table over gray levels, applied in that order
+    x = np.clip(np.arange(256, dtype=np.float64) * params.brightness, 0, 255)
+    if params.contrast != 1.0:
+        x = np.clip(mean + params.contrast * (x - mean), 0, 255)
+    low, high = params.levels_low, max(params.levels_high, params.levels_low + 1)
+    x = np.clip((x - low) / (high - low), 0, 1)
+    if params.gamma != 1.0:
+        x = x ** (1.0 / max(params.gamma, 1e-3))
+    x = x * 255
+    if params.curve:
+        xs, ys = zip(*params.curve)
+        x = np.interp(x, xs, ys)
+    lut = np.rint(x).astype(np.uint8)
+    lut[lut < params.black_clip] = 0
+    return lut
+
+def apply(gray, params, mean=None):
+    # One indexing pass over a uint8 gray array. Contrast pivots on `mean`,
+    # by default the mean of `gray` itself; pass the whole image's mean when
+    # toning a strip.
+    if mean is None and needs_mean(params):
+        mean = contrast_mean(histogram(gray), params.brightness)
+    return tone_lut(params, mean if mean is not None else 128)[gray]
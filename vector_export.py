@@ -0,0 +1,198 @@
+import math
+import os
+import zlib
+import numpy as np
+import palette
+import shapes
+import tiled
+import tone
+
+EXTS = {".svg", ".pdf"}
+BAND_PIXELS = 1 << 22  # zoomed gray pixels resampled per band of cell rows
+KAPPA = 0.5522847498  # cubic Bezier quarter circle
+
+def is_vector(path):
+    return os.path.splitext(path)[1].lower() in EXTS
+
+def _num(v):
+    return f"{v:.3f}".rstrip("0").rstrip(".")
+
+def cells(img, params):
+    # Yields (rows, cols, sizes, angles) of the non-empty cells band by band,
+    # the grid shapes.render draws for the same settings. Cell brightness is
+    # measured on the zoomed, toned gray of the raster path, resampled one
+    # band of cell rows at a time, so sizes match the raster at any zoom
+    # while only a band of the enlarged image is ever held.
+    gray = img.convert("L")
+    out_w, out_h = tiled.output_size(img, params.zoom)
+    detail = params.detail
+
+    def source(y0, y1):
+        return tiled.resize_rows(gray, (out_w, out_h), y0, y1)
+    mean = tiled.strip_contrast_mean(source, params, out_w, out_h) if tone.needs_mean(params) else 128
+    tone_lut = tone.tone_lut(params, mean)
+    gh = -(-out_h // detail)
+    band = max(1, BAND_PIXELS // (out_w * detail))
+    kind = shapes.shape_kind(params.shape)
+    rotate = kind != "circle" and "random" in params.shape.lower()
+    for r0 in range(0, gh, band):
+        r1 = min(gh, r0 + band)
+        toned = tone_lut[source(r0 * detail, min(out_h, r1 * detail))]
+        sizes = shapes.dot_sizes(shapes.block_means(toned, detail), params.threshold, params.dot_size)
+        rows, cols = np.nonzero(sizes)
+        rows += r0
+        angles = shapes.cell_angles(rows, cols) if rotate else np.zeros_like(rows)
+        yield rows, cols, sizes[rows - r0, cols], angles
+
+def outline(kind, size, angle_step):
+    # Corners of a square or triangle around its centre, as shapes.stamp draws it
+    corners = 4 if kind == "square" else 3
+    spread = math.pi/4 if kind == "square" else 2*math.pi/3
+    rad = math.radians(angle_step * 360 / shapes.ANGLE_STEPS)
+    half = size/2
+    return [(half*math.cos(rad + spread*i), half*math.sin(rad + spread*i)) for i in range(corners)]
+
+def circle_radius(size):
+    # shapes.stamp fills a (size//2*2+1) pixel disc
+    return size // 2 + 0.5
+
+def symbol_keys(params):
+    angles = range(shapes.ANGLE_STEPS) if shapes.shape_kind(params.shape) != "circle" and "random" in params.shape.lower() else [0]
+    return [(size, angle) for size in range(1, params.dot_size + 1) for angle in angles]
+
+def symbol_id(kind, size, angle):
+    return f"{kind[0]}{size}" if kind == "circle" else f"{kind[0]}{size}_{angle}"
+
+def fills(params):
+    # Background and shape colours, the two ends of the colorize LUT
+    lut = palette.build_lut(params.palette, params.hue) if params.color_mode == "color" else np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1)
+    return tuple(int(v) for v in lut[0]), tuple(int(v) for v in lut[255])
+
+def write_svg(img, path, params):
+    # Every possible (size, angle) shape is defined once up front so the
+    # cells can be streamed as <use> references in a single pass
+    kind = shapes.shape_kind(params.shape)
+    out_w, out_h = int(img.width * params.zoom), int(img.height * params.zoom)
+    background, ink = fills(params)
+    offset = _num(params.detail // 2 + 0.5)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    count = 0
+    with open(tmp, "w") as f:
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                f'width="{out_w}" height="{out_h}" viewBox="0 0 {out_w} {out_h}">\n<defs>\n')
+        for size, angle in symbol_keys(params):
+            if kind == "circle":
+                f.write(f'<circle id="{symbol_id(kind, size, angle)}" r="{_num(circle_radius(size))}"/>\n')
+            else:
+                points = " ".join(f"{_num(x)},{_num(y)}" for x, y in outline(kind, size, angle))
+                f.write(f'<polygon id="{symbol_id(kind, size, angle)}" points="{points}"/>\n')
+        f.write(f'</defs>\n<rect width="{out_w}" height="{out_h}" fill="#{"%02x%02x%02x" % background}"/>\n'
+                f'<g fill="#{"%02x%02x%02x" % ink}" transform="translate({offset} {offset})">\n')
+        d = params.detail
+        for rows, cols, sizes, angles in cells(img, params):
+            f.write("".join(f'<use xlink:href="#{symbol_id(kind, s, a)}" x="{c * d}" y="{r * d}"/>\n'
+                            for r, c, s, a in zip(rows.tolist(), cols.tolist(), sizes.tolist(), angles.tolist())))
+            count += len(rows)
+        f.write("</g>\n</svg>\n")
+    os.replace(tmp, path)
+    return count
+
+class _PdfFile:
+    # Minimal PDF object writer: tracks byte offsets for the xref table
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        self.pos = 0
+        self.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def write(self, data):
+        self.f.write(data)
+        self.pos += len(data)
+
+    def begin(self, num):
+        self.offsets[num] = self.pos
+        self.write(f"{num} 0 obj\n".encode())
+
+    def obj(self, num, body):
+        self.begin(num)
+        self.write(body.encode() + b"\nendobj\n")
+
+    def stream(self, num, head, data):
+        self.begin(num)
+        self.write(f"<< {head} /Length {len(data)} >>\nstream\n".encode() + data + b"\nendstream\nendobj\n")
+
+    def finish(self, root):
+        size = max(self.offsets) + 1
+        xref = self.pos
+        self.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+        self.write("".join(f"{self.offsets.get(i, 0):010d} 00000 n \n" for i in range(1, size)).encode())
+        self.write(f"trailer\n<< /Size {size} /Root {root} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+def _pdf_shape(kind, size, angle):
+    if kind == "circle":
+        r = circle_radius(size)
+        k = r * KAPPA
+        curves = [(r, k, k, r, 0, r), (-k, r, -r, k, -r, 0), (-r, -k, -k, -r, 0, -r), (k, -r, r, -k, r, 0)]
+        return f"{_num(r)} 0 m\n" + "".join(" ".join(_num(v) for v in curve) + " c\n" for curve in curves) + "f"
+    points = outline(kind, size, angle)
+    return f"{_num(points[0][0])} {_num(points[0][1])} m\n" + "".join(f"{_num(x)} {_num(y)} l\n" for x, y in points[1:]) + "h f"
+
+def write_pdf(img, path, params):
+    # One page, 1 output pixel = 1 pt, drawn top-down. Each used (size,
+    # angle) shape is a form XObject and cells are streamed into one
+    # compressed content stream as references to them.
+    kind = shapes.shape_kind(params.shape)
+    out_w, out_h = int(img.width * params.zoom), int(img.height * params.zoom)
+    background, ink = fills(params)
+    d = params.detail
+    offset = d // 2 + 0.5
+    rgb = lambda c: " ".join(_num(v / 255) for v in c)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    used = {}
+    count = 0
+    with open(tmp, "wb") as f:
+        pdf = _PdfFile(f)
+        pdf.obj(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        pdf.obj(2, "<< /Type /Pages /Kids [3 0 R] /Count 1 >>")
+        pdf.obj(3, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {out_w} {out_h}] /Resources 6 0 R /Contents 4 0 R >>")
+        pdf.begin(4)
+        pdf.write(b"<< /Filter /FlateDecode /Length 5 0 R >>\nstream\n")
+        start = pdf.pos
+        deflate = zlib.compressobj(6)
+        pdf.write(deflate.compress(f"1 0 0 -1 0 {out_h} cm\n{rgb(background)} rg\n0 0 {out_w} {out_h} re f\n"
+                                   f"{rgb(ink)} rg\n1 0 0 1 {_num(offset)} {_num(offset)} cm\n".encode()))
+        for rows, cols, sizes, angles in cells(img, params):
+            ops = []
+            for r, c, s, a in zip(rows.tolist(), cols.tolist(), sizes.tolist(), angles.tolist()):
+                name = symbol_id(kind, s, a)
+                used[name] = s, a
+                ops.append(f"q 1 0 0 1 {c * d} {r * d} cm /{name} Do Q\n")
+            pdf.write(deflate.compress("".join(ops).encode()))
+            count += len(rows)
+        pdf.write(deflate.flush())
+        length = pdf.pos - start
+        pdf.write(b"\nendstream\nendobj\n")
+        pdf.obj(5, str(length))
+        names = sorted(used)
+        pdf.obj(6, "<< /XObject << " + " ".join(f"/{n} {7 + i} 0 R" for i, n in enumerate(names)) + " >> >>")
+        for i, n in enumerate(names):
+            size, angle = used[n]
+            r = _num(shapes.stamp_radius(size))
+            pdf.stream(7 + i, f"/Type /XObject /Subtype /Form /BBox [-{r} -{r} {r} {r}]", _pdf_shape(kind, size, angle).encode())
+        pdf.finish(1)
+    os.replace(tmp, path)
+    return count
+
+def export(img, path, params):
+    # Writes the shape dither of img as SVG or PDF by extension; returns the
+    # number of shapes written
+    if not is_vector(path):
+        raise ValueError(f"Vector export writes .svg or .pdf, not {os.path.splitext(path)[1] or 'no extension'}")
+    writer = write_pdf if path.lower().endswith(".pdf") else write_svg
+    try:
+        return writer(img, path, params)
+    except BaseException:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
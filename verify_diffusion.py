@@ -0,0 +1,117 @@
+import argparse
+import sys
+import numpy as np
+import color_dither
+import error_diffusion
+import palette
+
+STRIP_ROWS = 7  # odd, so strips start on both scan directions
+
+def baseline_floyd_steinberg(arr, threshold):
+    # The loop error_diffusion replaced, kept as the reference
+    arr = arr.astype(float)
+    h, w = arr.shape
+    for y in range(h):
+        for x in range(w):
+            old = arr[y, x]
+            new = 255 if old > threshold else 0
+            arr[y, x] = new
+            err = old - new
+            if x+1<w: arr[y, x+1] += err*7/16
+            if x-1>=0 and y+1<h: arr[y+1, x-1] += err*3/16
+            if y+1<h: arr[y+1, x] += err*5/16
+            if x+1<w and y+1<h: arr[y+1, x+1] += err*1/16
+    return np.clip(arr,0,255).astype(np.uint8)
+
+def baseline_atkinson(arr, threshold):
+    arr = arr.astype(float)
+    h, w = arr.shape
+    for y in range(h):
+        for x in range(w):
+            old = arr[y, x]
+            new = 255 if old > threshold else 0
+            arr[y, x] = new
+            err = (old - new)/8
+            for dx, dy in [(1,0),(2,0),(-1,1),(0,1),(1,1),(0,2)]:
+                nx, ny = x+dx, y+dy
+                if 0<=nx<w and 0<=ny<h:
+                    arr[ny, nx] += err
+    return np.clip(arr,0,255).astype(np.uint8)
+
+def baseline_loop(arr, threshold, kernel, serpentine):
+    # The same per-pixel push loop for any kernel; serpentine rows run right
+    # to left with the kernel mirrored
+    divisor, taps = error_diffusion.KERNELS[kernel]
+    arr = arr.astype(float)
+    h, w = arr.shape
+    for y in range(h):
+        sign = -1 if serpentine and y % 2 else 1
+        for x in (range(w - 1, -1, -1) if sign < 0 else range(w)):
+            old = arr[y, x]
+            new = 255 if old > threshold else 0
+            arr[y, x] = new
+            err = old - new
+            for dx, dy, weight in taps:
+                nx, ny = x + sign * dx, y + dy
+                if 0 <= nx < w and ny < h:
+                    arr[ny, nx] += err * weight / divisor
+    return np.clip(arr, 0, 255).astype(np.uint8)
+
+def test_image(w, h, seed=0):
+    y = np.linspace(0, 1, h)[:, None]
+    x = np.linspace(0, 1, w)[None, :]
+    noise = np.random.default_rng(seed).integers(0, 64, (h, w))
+    return np.clip((x * 0.5 + y * 0.3) * 255 + noise - 32, 0, 255).astype(np.uint8)
+
+def backends(serpentine):
+    names = [b for b in error_diffusion.BACKENDS if b != "numba" or error_diffusion.numba is not None]
+    return [b for b in names if b != "wavefront" or not serpentine]
+
+def run(arr, threshold, kernel, serpentine, backend, quantizer=None):
+    # In strips, so the carry between strips is checked too
+    diffuser = error_diffusion.ErrorDiffuser(arr.shape[1], threshold, kernel, serpentine, quantizer=quantizer,
+                                             backend=backend)
+    return np.concatenate([diffuser.process(arr[y:y + STRIP_ROWS]) for y in range(0, arr.shape[0], STRIP_ROWS)])
+
+def verify(w, h, threshold):
+    # Yields (description, ok) for every kernel, scan order and backend
+    gray = test_image(w, h)
+    rgb = np.stack([test_image(w, h, seed) for seed in range(3)], -1)
+    rgb8 = color_dither.Quantizer(2, threshold)
+    # No per-pixel reference for these; the backends are checked against each other
+    others = {"27 colors": color_dither.Quantizer(3, threshold),
+              "Game Boy": color_dither.Quantizer(threshold=threshold, colors=palette.PALETTES["Game Boy"][1])}
+    literal = {"Floyd-Steinberg": baseline_floyd_steinberg, "Atkinson": baseline_atkinson}
+    for kernel in error_diffusion.KERNELS:
+        for serpentine in (False, True):
+            scan = "serpentine" if serpentine else "raster"
+            ref = baseline_loop(gray, threshold, kernel, serpentine)
+            if kernel in literal and not serpentine:
+                yield f"{kernel} {scan} baseline loop", np.array_equal(ref, literal[kernel](gray, threshold))
+            ref_rgb = np.stack([baseline_loop(rgb[..., c], threshold, kernel, serpentine) for c in range(3)], -1)
+            for backend in backends(serpentine):
+                yield f"{kernel} {scan} {backend}", np.array_equal(run(gray, threshold, kernel, serpentine, backend), ref)
+                yield (f"{kernel} {scan} {backend} RGB (8 colors)",
+                       np.array_equal(run(rgb, threshold, kernel, serpentine, backend, rgb8), ref_rgb))
+            names = backends(serpentine)
+            for name, quantizer in others.items():
+                first = run(rgb, threshold, kernel, serpentine, names[0], quantizer)
+                for backend in names[1:]:
+                    yield (f"{kernel} {scan} {backend} RGB ({name}) vs {names[0]}",
+                           np.array_equal(run(rgb, threshold, kernel, serpentine, backend, quantizer), first))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check every error diffusion backend against the per-pixel loops.")
+    parser.add_argument("--size", default="61x43", help="test image size, WxH")
+    parser.add_argument("--threshold", type=int, default=128)
+    args = parser.parse_args(argv)
+    w, h = (int(v) for v in args.size.lower().split("x"))
+    failed = 0
+    for name, ok in verify(w, h, args.threshold):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        failed += not ok
+    print(f"{failed} failed" if failed else "All backends bit-identical to the per-pixel loops")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
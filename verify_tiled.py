@@ -0,0 +1,71 @@
+import argparse
+import os
+import sys
+import tempfile
+from dataclasses import replace
+import numpy as np
+from PIL import Image
+import batch
+import pipeline
+import tiled
+
+ZOOMS = [1.0, 0.5, 0.37, 1.7, 2.0]
+MEMORY_MB = 0.2  # small enough for dozens of strips on the test image
+
+def test_image(w, h, seed=0):
+    # Smooth colour ramps with noise, so resampling and tone both matter
+    y = np.linspace(0, 1, h)[:, None, None]
+    x = np.linspace(0, 1, w)[None, :, None]
+    ramp = x * np.array([0.7, 0.2, 0.5]) + y * np.array([0.2, 0.6, 0.4])
+    noise = np.random.default_rng(seed).integers(-40, 40, (h, w, 3))
+    return Image.fromarray(np.clip(ramp * 255 + noise, 0, 255).astype(np.uint8))
+
+def cases(zoom):
+    # (mode, params) pairs covering every streamed path
+    base = pipeline.DitherParams(zoom=zoom)
+    return [
+        ("dither", base),
+        ("dither", replace(base, algorithm="Atkinson", serpentine=True)),
+        ("dither", replace(base, algorithm="Jarvis-Judice-Ninke", contrast=1.4, brightness=0.2, gamma=1.3)),
+        ("dither", replace(base, algorithm="Ordered", threshold_map="Blue Noise", contrast=1.4)),
+        ("dither", replace(base, color_mode="color", palette="Sepia", contrast=1.2)),
+        ("shapes", replace(base, contrast=1.4)),
+        ("shapes", replace(base, shape="Squares (random)", color_mode="color", hue=0.6)),
+        ("dither", replace(base, color_mode="full", contrast=1.2)),
+        ("dither", replace(base, color_mode="full", full_palette="Sepia", algorithm="Atkinson", serpentine=True)),
+        ("dither", replace(base, color_mode="full", full_palette="Web Safe (216 colors)", algorithm="Jarvis-Judice-Ninke")),
+        ("dither", replace(base, color_mode="full", full_palette="Adaptive (16 colors)", algorithm="Ordered")),
+    ]
+
+def verify(img, zooms, workers):
+    # Yields (description, ok) comparing each streamed PNG with the in-memory render
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out.png")
+        for zoom in zooms:
+            for mode, params in cases(zoom):
+                ref = np.asarray(batch.RENDERERS[mode](img, params))
+                tiled.render_to_png(img, path, params, mode, MEMORY_MB, workers)
+                out = np.asarray(Image.open(path))
+                if out.ndim == 2 and ref.ndim == 3:
+                    ref = ref[..., 0]  # grayscale results are written as L
+                name = f"zoom {zoom:g} {mode} {params.algorithm} {params.color_mode}"
+                if params.color_mode == "full":
+                    name += f" {params.full_palette}"
+                yield name, out.shape == ref.shape and np.array_equal(out, ref)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that strip-streamed PNG saves match in-memory renders.")
+    parser.add_argument("--size", default="613x421", help="test image size, WxH")
+    parser.add_argument("--zooms", default=",".join(str(z) for z in ZOOMS), help="comma separated zoom factors")
+    parser.add_argument("-j", "--workers", type=int, default=3)
+    args = parser.parse_args(argv)
+    w, h = (int(v) for v in args.size.lower().split("x"))
+    failed = 0
+    for name, ok in verify(test_image(w, h), [float(z) for z in args.zooms.split(",") if z], args.workers):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        failed += not ok
+    print(f"{failed} failed" if failed else "Streamed saves match the in-memory renders")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import math
+from dataclasses import dataclass, replace
+import numpy as np
+from PIL import Image
+import palette
+import pipeline
+import shapes
+import tone
+
+TILE = 256
+MIN_SIDE = 256
+BACKGROUND = (0x22, 0x22, 0x22)
+HALO_DOT_SIZE = 12  # the Dot Size slider's maximum
+
+@dataclass(frozen=True)
+class View:
+    # What the canvas shows: the output point at its centre as fractions of
+    # the output size, screen pixels per full-resolution output pixel, and
+    # the canvas size
+    fx: float = 0.5
+    fy: float = 0.5
+    scale: float = 1.0
+    width: int = 1
+    height: int = 1
+
+class MipPyramid:
+    # Grayscale source at full resolution and at every halving down to
+    # MIN_SIDE. Rendering works from gray, so levels hold one channel.
+    def __init__(self, img, key):
+        self.key = key
+        self.size = img.size
+        gray = img.convert("L")
+        self.levels = [gray]
+        while max(gray.size) > MIN_SIDE:
+            gray = gray.reduce(2)
+            self.levels.append(gray)
+        self.hists = {}
+
+    def level_for(self, scale):
+        # Coarsest level still shown at one screen pixel per level pixel or
+        # more, so tiles are only ever enlarged for display
+        if scale >= 1:
+            return 0
+        return min(len(self.levels) - 1, int(math.floor(math.log2(1 / scale))))
+
+    def histogram(self, level):
+        if level not in self.hists:
+            self.hists[level] = np.array(self.levels[level].histogram(), np.int64)
+        return self.hists[level]
+
+def level_params(params, level):
+    # Shapes keep their size relative to the image at coarser levels
+    return replace(params, detail=max(1, params.detail >> level), dot_size=max(1, params.dot_size >> level))
+
+def output_size(size, zoom):
+    return int(size[0] * zoom), int(size[1] * zoom)
+
+def tile_size(params):
+    return max(1, TILE // params.detail) * params.detail
+
+def tile_bounds(params, out_w, out_h, ty, tx):
+    t = tile_size(params)
+    return ty * t, min(out_h, (ty + 1) * t), tx * t, min(out_w, (tx + 1) * t)
+
+def tile_halo(params):
+    # Margin of whole cells around a tile, wide enough for the largest dot
+    # the dock offers, so the resized region does not change with dot size
+    radius = shapes.stamp_radius(max(params.dot_size, HALO_DOT_SIZE))
+    return -(-radius // params.detail) * params.detail
+
+def tile_region(params, out_w, out_h, ty, tx):
+    # Output rows a:b and columns c:d a tile is rendered from
+    y0, y1, x0, x1 = tile_bounds(params, out_w, out_h, ty, tx)
+    halo = tile_halo(params)
+    return max(0, y0 - halo), min(out_h, y1 + halo), max(0, x0 - halo), min(out_w, x1 + halo)
+
+def tile_gray(pyramid, params, level, ty, tx):
+    # The pyramid level resized to the output over the tile and its halo
+    src = pyramid.levels[level]
+    out_w, out_h = output_size(src.size, params.zoom)
+    sx, sy = src.width / out_w, src.height / out_h
+    a, b, c, d = tile_region(params, out_w, out_h, ty, tx)
+    return np.array(src.resize((d - c, b - a), Image.LANCZOS, box=(c * sx, a * sy, d * sx, b * sy)))
+
+def tile_tone(pyramid, params, level, region):
+    # Contrast pivots on the level's unzoomed mean
+    mean = tone.contrast_mean(pyramid.histogram(level), params.brightness) if tone.needs_mean(params) else 128
+    return tone.tone_lut(params, mean)[region]
+
+def tile_shape(pyramid, params, level, ty, tx, toned):
+    out_w, out_h = output_size(pyramid.levels[level].size, params.zoom)
+    y0, y1, x0, x1 = tile_bounds(params, out_w, out_h, ty, tx)
+    a, _, c, _ = tile_region(params, out_w, out_h, ty, tx)
+    return shapes.render(toned, params.shape, params.dot_size, params.detail, params.threshold,
+                         cell_row0=a // params.detail, cell_col0=c // params.detail)[y0 - a:y1 - a, x0 - c:x1 - c]
+
+def color_lut(params):
+    if params.color_mode == "color":
+        return palette.build_lut(params.palette, params.hue)
+    return np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1)
+
+def tile_color(mask, lut):
+    return np.take(lut, mask, axis=0)  # several times faster than lut[mask]
+
+def render_tile(pyramid, params, level, ty, tx, stages=None, lut=None):
+    # One tile of the shape-dithered output of a pyramid level: that part of
+    # pipeline.render_shapes on the whole level, up to resampling rounding
+    # at fractional zoom. Like render_shapes, each step is its own stage, so
+    # a colour change only colorizes again and a shape change reuses the
+    # resized and toned region. `lut` is color_lut(params), passed in so a
+    # view builds it once rather than per tile.
+    stage = stages.stage if stages is not None else pipeline._run_stage
+    key = ("gray", pyramid.key, level, params.zoom, tile_size(params), tile_halo(params), ty, tx)
+    region = stage(key, lambda: tile_gray(pyramid, params, level, ty, tx))
+    key = ("tone", key) + tone.tone_key(params)
+    toned = stage(key, lambda: tile_tone(pyramid, params, level, region))
+    key = ("shape", key, params.shape, params.dot_size, params.detail, params.threshold)
+    mask = stage(key, lambda: tile_shape(pyramid, params, level, ty, tx, toned))
+    key = ("color", key) + pipeline.color_key(params)
+    return stage(key, lambda: tile_color(mask, color_lut(params) if lut is None else lut))
+
+def render_view(pyramid, params, view, stages, coarser=0):
+    # Canvas-sized RGB image of the view. Only tiles that intersect it are
+    # rendered, at the level matching the view scale (`coarser` levels
+    # above it for a quick pass). Every step of every tile is a stage keyed
+    # by level, position and the settings it depends on, so panning and
+    # zooming back reuse finished tiles and a setting change only redoes the
+    # steps after it.
+    level = min(len(pyramid.levels) - 1, pyramid.level_for(view.scale) + coarser)
+    p = level_params(params, level)
+    out_w, out_h = output_size(pyramid.levels[level].size, p.zoom)
+    full_w, _ = output_size(pyramid.size, p.zoom)
+    f = view.scale * full_w / max(out_w, 1)  # screen pixels per level pixel
+    cx, cy = view.fx * out_w, view.fy * out_h
+    x0, x1 = max(0, int(cx - view.width / (2 * f))), min(out_w, int(math.ceil(cx + view.width / (2 * f))))
+    y0, y1 = max(0, int(cy - view.height / (2 * f))), min(out_h, int(math.ceil(cy + view.height / (2 * f))))
+    canvas = Image.new("RGB", (max(1, view.width), max(1, view.height)), BACKGROUND)
+    if x1 <= x0 or y1 <= y0:
+        return canvas
+    t = tile_size(p)
+    lut = color_lut(p)
+    region = np.empty((y1 - y0, x1 - x0, 3), np.uint8)
+    for ty in range(y0 // t, (y1 - 1) // t + 1):
+        for tx in range(x0 // t, (x1 - 1) // t + 1):
+            tile = render_tile(pyramid, p, level, ty, tx, stages, lut)
+            ty0, tx0 = ty * t, tx * t
+            a, b = max(y0, ty0), min(y1, ty0 + tile.shape[0])
+            c, d = max(x0, tx0), min(x1, tx0 + tile.shape[1])
+            region[a - y0:b - y0, c - x0:d - x0] = tile[a - ty0:b - ty0, c - tx0:d - tx0]
+    shown = Image.fromarray(region).resize((max(1, round((x1 - x0) * f)), max(1, round((y1 - y0) * f))), Image.NEAREST)
+    canvas.paste(shown, (round(view.width / 2 + (x0 - cx) * f), round(view.height / 2 + (y0 - cy) * f)))
+    return canvas
+
+def fit_scale(size, zoom, width, height):
+    # View scale that shows the whole output in a width x height canvas
+    out_w, out_h = output_size(size, zoom)
+    return min(width / max(out_w, 1), height / max(out_h, 1), 1.0)
@@ -0,0 +1,342 @@
+import argparse
+import ctypes
+import ctypes.util
+import json
+import multiprocessing
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, fields
+from PIL import Image
+import batch
+import pipeline
+import vector_export
+
+JOURNAL = ".dither_journal.jsonl"
+POLL_S = 2.0
+SETTLE_S = 1.0
+RETRIES = 2
+RETRY_DELAY_S = 5.0
+
+def load_preset(path):
+    # JSON object of DitherParams fields, plus "mode" (shapes or dither) and
+    # "format" (output extension such as png, jpg, svg or pdf; default: keep
+    # the source's). Returns (params, mode, format).
+    with open(path) as f:
+        data = json.load(f)
+    mode = data.pop("mode", "shapes")
+    fmt = data.pop("format", None)
+    unknown = set(data) - {f.name for f in fields(pipeline.DitherParams)}
+    if unknown:
+        raise ValueError(f"Unknown preset settings: {', '.join(sorted(unknown))}")
+    if mode not in batch.RENDERERS:
+        raise ValueError(f"Unknown mode: {mode}")
+    if fmt is not None and f".{fmt}".lower() not in pipeline.IMAGE_EXTS | vector_export.EXTS:
+        raise ValueError(f"Unknown output format: {fmt}")
+    if "curve" in data:
+        data["curve"] = tuple(tuple(point) for point in data["curve"])
+    return pipeline.DitherParams(**data), mode, fmt
+
+def save_preset(path, params, mode="shapes", fmt=None):
+    data = dict(asdict(params), mode=mode)
+    if fmt:
+        data["format"] = fmt
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+class Inotify:
+    # Linux inotify through ctypes. Only wakes the scanner early: files
+    # reported here were closed after writing or moved in, so they are
+    # complete without waiting for them to settle.
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def wait(self, timeout):
+        # Names reported within timeout seconds
+        names = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return names
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return names
+        pos = 0
+        while pos + 16 <= len(data):
+            length = struct.unpack_from("iIII", data, pos)[3]
+            name = data[pos + 16:pos + 16 + length].rstrip(b"\0")
+            if name:
+                names.add(os.fsdecode(name))
+            pos += 16 + length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+def open_inotify(folder):
+    # None where inotify is unavailable; polling alone still finds every file
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return Inotify(folder)
+    except (OSError, AttributeError):
+        return None
+
+class Journal:
+    # Append-only JSON lines record of finished files, keyed by name, size
+    # and mtime: a file runs once across restarts, a replaced one runs again.
+    # Compacted to the latest entry per key on open.
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    self.entries[tuple(entry["key"])] = entry
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in self.entries.values())
+            os.replace(tmp, path)
+        self.file = open(path, "a")
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def record(self, key, **info):
+        entry = dict(key=list(key), **info)
+        self.entries[key] = entry
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+def scan(folder, settle, fresh=()):
+    # (ready keys, whether any file is still settling). A file is ready once
+    # it has not been modified for `settle` seconds, or when in `fresh`.
+    ready, settling = [], False
+    now = time.time()
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or os.path.splitext(entry.name)[1].lower() not in pipeline.IMAGE_EXTS:
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name in fresh or now - st.st_mtime >= settle:
+                ready.append((entry.name, st.st_size, st.st_mtime_ns))
+            else:
+                settling = True
+    return sorted(ready), settling
+
+def warm(params, mode):
+    # Pool initializer: a tiny render pays for imports, threshold maps, shape
+    # stamps and numba compilation before the first real file arrives
+    sample = Image.linear_gradient("L").resize((64, 64)).convert("RGB")
+    batch.RENDERERS[mode](sample, params)
+
+def process_atomic(src, dst, params, mode, memory_mb=None):
+    # batch.process_file into a hidden file beside dst that is renamed into
+    # place once complete, so readers of the output folder never see a
+    # partial image
+    folder, base = os.path.split(dst)
+    name, ext = os.path.splitext(base)
+    tmp = os.path.join(folder, f".{name}.{os.getpid()}.part{ext}")
+    result = batch.process_file(src, tmp, params, mode, memory_mb)
+    if not result.error:
+        try:
+            os.replace(tmp, dst)
+        except OSError as e:
+            result.error = f"{type(e).__name__}: {e}"
+    if result.error and os.path.exists(tmp):
+        os.remove(tmp)
+    result.dst = dst
+    return result
+
+class WatchFolder:
+    # Headless hot-folder processor. New images in input_dir are queued and
+    # rendered by a pool of warm worker processes that lives as long as the
+    # watcher. At most max_pending files are submitted at once; the rest wait
+    # in the queue. Failed files are retried with doubling delays, then
+    # recorded as failed. The journal in output_dir makes every file run once.
+    def __init__(self, input_dir, output_dir, params, mode="shapes", fmt=None, workers=None, max_pending=None,
+                 retries=RETRIES, retry_delay=RETRY_DELAY_S, poll=POLL_S, settle=SETTLE_S, memory_mb=None,
+                 use_inotify=True, log=print):
+        if os.path.realpath(input_dir) == os.path.realpath(output_dir):
+            raise ValueError("The output folder must differ from the watched folder")
+        if fmt in ("svg", "pdf") and mode != "shapes":
+            raise ValueError("SVG and PDF output needs shape dithering")
+        self.input_dir, self.output_dir = input_dir, output_dir
+        self.params, self.mode, self.fmt = params, mode, fmt
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.max_pending = max(1, max_pending or self.workers * 2)
+        self.retries, self.retry_delay = retries, retry_delay
+        self.poll, self.settle = poll, settle
+        self.memory_mb = memory_mb
+        self.use_inotify = use_inotify
+        self.log = log
+        self.done = self.failed = 0
+
+    def output_path(self, name):
+        stem, ext = os.path.splitext(name)
+        return os.path.join(self.output_dir, f"{stem}_dithered{'.' + self.fmt if self.fmt else ext}")
+
+    def start_pool(self):
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=warm, initargs=(self.params, self.mode))
+
+    def run(self, stop=None, once=False):
+        # Blocks until `stop` is set, or with once=True until every file
+        # present has been handled. Files in flight when stopping are
+        # finished; queued ones are picked up by the next run.
+        stop = stop or threading.Event()
+        os.makedirs(self.output_dir, exist_ok=True)
+        for entry in os.scandir(self.output_dir):
+            if entry.name.startswith(".") and ".part" in entry.name:
+                os.remove(entry.path)  # left by a worker killed mid-write
+        journal = Journal(os.path.join(self.output_dir, JOURNAL))
+        notify = open_inotify(self.input_dir) if self.use_inotify else None
+        self.log(f"Watching {self.input_dir} ({'inotify' if notify else 'polling'}, {self.workers} workers)")
+        pool = self.start_pool()
+        queued = deque()
+        retry_at = {}  # key -> (due time, attempts so far)
+        in_flight = {}  # future -> (key, attempts so far)
+        known = set()  # queued, retrying or in flight
+        fresh = set()
+        last_scan = settling = None
+        try:
+            while not stop.is_set():
+                now = time.time()
+                if fresh or last_scan is None or now - last_scan >= self.poll:
+                    ready, settling = scan(self.input_dir, self.settle, fresh)
+                    last_scan = now
+                    fresh.clear()
+                    for key in ready:
+                        if key not in known and key not in journal:
+                            known.add(key)
+                            queued.append((key, 0))
+                for key, (due, attempts) in list(retry_at.items()):
+                    if due <= now:
+                        del retry_at[key]
+                        queued.append((key, attempts))
+                while queued and len(in_flight) < self.max_pending:
+                    key, attempts = queued.popleft()
+                    src = os.path.join(self.input_dir, key[0])
+                    future = pool.submit(process_atomic, src, self.output_path(key[0]), self.params, self.mode, self.memory_mb)
+                    in_flight[future] = key, attempts
+                if once and not (queued or in_flight or retry_at or settling):
+                    break
+                timeout = max(0.05, min([self.poll - (time.time() - last_scan), self.settle if settling else self.poll]
+                                        + [due - time.time() for due, _ in retry_at.values()]))
+                if in_flight:
+                    finished, _ = wait(in_flight, timeout=min(timeout, 0.5), return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        key, attempts = in_flight.pop(future)
+                        self.finish(journal, key, attempts, self.result(future, key), known, retry_at)
+                    if any(isinstance(f.exception(), BrokenProcessPool) for f in finished):
+                        # A worker died and took the pool with it: whatever is
+                        # still in flight fails the same way, then start afresh
+                        for future, (key, attempts) in in_flight.items():
+                            self.finish(journal, key, attempts, self.result(future, key), known, retry_at)
+                        in_flight.clear()
+                        pool.shutdown(wait=False)
+                        pool = self.start_pool()
+                    if notify is not None:
+                        fresh |= notify.wait(0)
+                elif notify is not None:
+                    fresh |= notify.wait(min(timeout, 1.0))  # select does not return on a stop signal
+                else:
+                    stop.wait(timeout)
+            for future in list(in_flight):
+                if future.cancel():
+                    del in_flight[future]
+            for future in list(in_flight):
+                key, attempts = in_flight.pop(future)
+                self.finish(journal, key, attempts, self.result(future, key), known, retry_at)
+        finally:
+            pool.shutdown(cancel_futures=True)
+            journal.close()
+            if notify is not None:
+                notify.close()
+        self.log(f"Stopped: {self.done} done, {self.failed} failed")
+
+    def result(self, future, key):
+        # Anything a worker raises instead of reporting (a dead pool, a
+        # result that cannot be unpickled) fails this attempt like an error
+        # result would, rather than stopping the watcher
+        try:
+            return future.result()
+        except Exception as e:
+            return batch.FileResult(os.path.join(self.input_dir, key[0]), self.output_path(key[0]), error=f"{type(e).__name__}: {e}")
+
+    def finish(self, journal, key, attempts, result, known, retry_at):
+        attempts += 1
+        if not result.error:
+            journal.record(key, status="done", output=result.dst, seconds=round(result.seconds, 6), attempts=attempts, time=time.time())
+            known.discard(key)
+            self.done += 1
+            self.log(f"Done {key[0]} -> {result.dst} in {result.seconds:.2f}s")
+        elif not os.path.exists(os.path.join(self.input_dir, key[0])):
+            known.discard(key)  # removed or replaced; a replacement has a new key
+            self.log(f"Skipped {key[0]}: file is gone")
+        elif attempts <= self.retries:
+            delay = self.retry_delay * 2 ** (attempts - 1)
+            retry_at[key] = time.time() + delay, attempts
+            self.log(f"Error processing {key[0]}: {result.error}; retrying in {delay:g}s")
+        else:
+            journal.record(key, status="failed", error=result.error, attempts=attempts, time=time.time())
+            known.discard(key)
+            self.failed += 1
+            self.log(f"Failed {key[0]} after {attempts} attempts: {result.error}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dither every image dropped into a folder, until stopped.")
+    parser.add_argument("input", help="folder to watch")
+    parser.add_argument("output", help="folder for results and the processed-files journal")
+    parser.add_argument("--preset", help="JSON settings file (File > Save Settings as Preset... in the GUI)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument("--max-pending", type=int, help="files submitted to the workers at once (default: 2 per worker)")
+    parser.add_argument("--retries", type=int, default=RETRIES, help="extra attempts for a failing file")
+    parser.add_argument("--retry-delay", type=float, default=RETRY_DELAY_S, help="seconds before the first retry; doubles each time")
+    parser.add_argument("--poll", type=float, default=POLL_S, help="seconds between folder scans")
+    parser.add_argument("--settle", type=float, default=SETTLE_S, help="seconds a file must be unmodified before it is read")
+    parser.add_argument("--memory-mb", type=float, help="stream large PNG outputs in strips within this memory budget")
+    parser.add_argument("--no-inotify", action="store_true", help="only poll, even where inotify is available")
+    parser.add_argument("--once", action="store_true", help="process the files present now, then exit")
+    args = parser.parse_args(argv)
+    params, mode, fmt = load_preset(args.preset) if args.preset else (pipeline.DitherParams(), "shapes", None)
+    watcher = WatchFolder(args.input, args.output, params, mode, fmt, args.workers, args.max_pending, args.retries,
+                          args.retry_delay, args.poll, args.settle, args.memory_mb, not args.no_inotify)
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    watcher.run(stop, once=args.once)
+    return 1 if watcher.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())